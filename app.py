@@ -1,13 +1,32 @@
 from aws_cdk import core
 
-from stacks.synth import synth_stacks
+from stacks.synth import (
+    get_selected_stack,
+    get_synth_cache_dir,
+    get_synth_workers,
+    synth_stacks,
+    synth_stacks_cached,
+    synth_stacks_parallel,
+)
 
 
 def build():
     app = core.App()
+    workers = get_synth_workers(app)
+
+    cache_dir = get_synth_cache_dir(app)
+    if cache_dir:
+        synth_stacks_cached(app.outdir, cache_dir, workers, get_selected_stack(app))
+        return
+
+    if workers > 1 and not get_selected_stack(app):
+        synth_stacks_parallel(app.outdir, workers)
+        return
+
     synth_stacks(app)
     app.synth()
 
 
-build()
-
+# worker processes import this module too, only the main process builds
+if __name__ == '__main__':
+    build()
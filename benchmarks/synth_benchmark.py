@@ -0,0 +1,157 @@
+"""
+Synth benchmark: times `synth_stacks` over N generated stack configs.
+
+    python -m benchmarks.synth_benchmark --stacks 20 --output bench.json
+
+Reports the construct and template phases, the peak RSS of both the python process and
+its jsii (node) runtime, and the time spent in each resource step of `PlatformStack.synth`.
+"""
+import argparse
+import functools
+import inspect
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+os.environ.setdefault('AWS_ACCOUNT_ID', '123456789012')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from aws_cdk import core  # noqa: E402
+
+from stacks import stacks as platform_stacks  # noqa: E402
+from stacks.settings import StackConfig  # noqa: E402
+from stacks.synth import get_cdk_version, synth_stacks  # noqa: E402
+
+BASE_CONFIG = {
+    'stack_label': 'benchmark',
+    'kms_key_uuid': '00000000-0000-0000-0000-000000000000',
+    'cache_node_type': 'cache.t3.micro',
+    'num_cache_nodes': 1,
+    'database_size': 't3.micro',
+    'database_name': 'benchmark',
+    'database_username': 'benchmark',
+    'database_allocated_storage': 25,
+    'database_encrypted': False,
+    'artifact_bucket': 'benchmark-artifacts',
+    'certificate_key_id': '00000000-0000-0000-0000-000000000000',
+    'repo_owner': 'benchmark',
+    'repo_name': 'benchmark',
+    'repo_branch': 'master',
+    'dns_name': 'example.com',
+    'dns_zone_id': 'Z0000000000000',
+    'github_access_token': 'benchmark',
+    'enable_deploy_approval': False,
+    'datadog_api_key': 'benchmark',
+    'desired_app_count': 1,
+    'desired_worker_count': 1,
+    'docker_user': 'benchmark',
+    'docker_password': 'benchmark',
+}
+
+
+def make_configs(count: int) -> List[StackConfig]:
+    return [
+        StackConfig(
+            stack_name=f'benchmark-{index}',
+            dns_stack_subdomain=f'benchmark-{index}',
+            **BASE_CONFIG,
+        )
+        for index in range(count)
+    ]
+
+
+def timed(name: str, function, timings: Dict[str, List[float]]):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings.setdefault(name, []).append(time.perf_counter() - started)
+    return wrapper
+
+
+def instrument_steps(timings: Dict[str, List[float]]):
+    """Wraps every resource function used by the stacks, returns the originals."""
+    originals = {}
+    for name, function in vars(platform_stacks).items():
+        if inspect.isfunction(function) and function.__module__.startswith('stacks.resources'):
+            originals[name] = function
+            setattr(platform_stacks, name, timed(name, function, timings))
+    return originals
+
+
+def runtime_peak_rss_kb() -> int:
+    """Peak RSS of the child processes (the jsii runtime), Linux only."""
+    peak = 0
+    pid = os.getpid()
+    for task in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{task}/children') as children:
+            for child in children.read().split():
+                with open(f'/proc/{child}/status') as status:
+                    for line in status:
+                        if line.startswith('VmHWM:'):
+                            peak = max(peak, int(line.split()[1]))
+    return peak
+
+
+def run(stack_count: int) -> dict:
+    timings = {}
+    configs = make_configs(stack_count)
+    originals = instrument_steps(timings)
+
+    try:
+        with tempfile.TemporaryDirectory() as outdir:
+            started = time.perf_counter()
+            app = core.App(outdir=outdir)
+            synth_stacks(app, configs)
+            constructed = time.perf_counter()
+            app.synth()
+            finished = time.perf_counter()
+    finally:
+        for name, function in originals.items():
+            setattr(platform_stacks, name, function)
+
+    return {
+        'stacks': stack_count,
+        'cdk_version': get_cdk_version(),
+        'python_version': platform.python_version(),
+        'construct_seconds': round(constructed - started, 4),
+        'synth_seconds': round(finished - constructed, 4),
+        'total_seconds': round(finished - started, 4),
+        'peak_rss_kb': {
+            'python': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'runtime': runtime_peak_rss_kb() if sys.platform.startswith('linux') else None,
+        },
+        'steps': {
+            name: {
+                'calls': len(durations),
+                'total_seconds': round(sum(durations), 4),
+                'mean_seconds': round(sum(durations) / len(durations), 4),
+            }
+            for name, durations in sorted(timings.items(), key=lambda item: -sum(item[1]))
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the synthesis of generated stacks.')
+    parser.add_argument('--stacks', type=int, default=10, help='number of generated stack configs')
+    parser.add_argument('--output', help='JSON file for the results, stdout by default')
+    args = parser.parse_args()
+
+    results = json.dumps(run(args.stacks), indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(results)
+    else:
+        print(results)
+
+
+if __name__ == '__main__':
+    main()
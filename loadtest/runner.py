@@ -0,0 +1,129 @@
+"""
+Load test runner: drives a Locust master through its web API and keeps the results.
+
+    python -m loadtest.runner --master http://localhost:8089 --host https://api.example.com \
+        --users 100 --spawn-rate 10 --duration 300 --results-dir results
+
+Runs next to the Locust master of a stack (the results are uploaded to the stack bucket), or
+locally against `loadtest.stub_server`. It only relies on the standard library.
+"""
+import argparse
+import json
+import os
+import time
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+
+POLL_SECONDS = 10
+RESULT_FILES = {
+    'requests.csv': '/stats/requests/csv',
+    'failures.csv': '/stats/failures/csv',
+}
+
+
+def request(master_url: str, path: str, data: dict = None) -> bytes:
+    body = urllib.parse.urlencode(data).encode() if data is not None else None
+    with urllib.request.urlopen(f'{master_url}{path}', data=body, timeout=30) as response:
+        return response.read()
+
+
+def get_stats(master_url: str) -> dict:
+    return json.loads(request(master_url, '/stats/requests'))
+
+
+def wait_for_master(master_url: str, timeout: int):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return get_stats(master_url)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1)
+
+
+def wait_for_workers(master_url: str, workers: int, timeout: int):
+    deadline = time.monotonic() + timeout
+    while get_stats(master_url).get('worker_count', 0) < workers:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'Less than {workers} Locust workers connected after {timeout}s')
+        time.sleep(POLL_SECONDS)
+
+
+def summarize(stats: dict) -> dict:
+    aggregated = next((row for row in stats.get('stats', []) if row.get('name') == 'Aggregated'), {})
+    return {
+        'user_count': stats.get('user_count'),
+        'worker_count': stats.get('worker_count'),
+        'total_rps': stats.get('total_rps'),
+        'fail_ratio': stats.get('fail_ratio'),
+        'num_requests': aggregated.get('num_requests'),
+        'num_failures': aggregated.get('num_failures'),
+        'avg_response_time': aggregated.get('avg_response_time'),
+        'max_response_time': aggregated.get('max_response_time'),
+        'response_time_percentiles': {
+            key.replace('response_time_percentile_', 'p'): value
+            for key, value in stats.items() if key.startswith('response_time_percentile_')
+        },
+        'errors': stats.get('errors', []),
+    }
+
+
+def run(args: argparse.Namespace) -> str:
+    wait_for_master(args.master, args.timeout)
+    wait_for_workers(args.master, args.workers, args.timeout)
+
+    request(args.master, '/swarm', {
+        'user_count': args.users,
+        'spawn_rate': args.spawn_rate,
+        'host': args.host,
+    })
+    started_at = datetime.now(timezone.utc)
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        time.sleep(min(POLL_SECONDS, max(deadline - time.monotonic(), 0)))
+        stats = get_stats(args.master)
+        print(f'{stats.get("user_count")} users, {stats.get("total_rps")} rps, fail ratio {stats.get("fail_ratio")}')
+
+    stats = get_stats(args.master)
+    results_dir = os.path.join(args.results_dir, started_at.strftime('%Y%m%dT%H%M%SZ'))
+    os.makedirs(results_dir, exist_ok=True)
+    for file_name, path in RESULT_FILES.items():
+        with open(os.path.join(results_dir, file_name), 'wb') as result_file:
+            result_file.write(request(args.master, path))
+    request(args.master, '/stop')
+
+    summary = {
+        'host': args.host,
+        'users': args.users,
+        'spawn_rate': args.spawn_rate,
+        'duration': args.duration,
+        'started_at': started_at.isoformat(),
+        **summarize(stats),
+    }
+    with open(os.path.join(results_dir, 'summary.json'), 'w') as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    return results_dir
+
+
+def main(argv=None):
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description='Runs a load test on a Locust master')
+    parser.add_argument('--master', default=env('LOCUST_MASTER_URL', 'http://localhost:8089'))
+    parser.add_argument('--host', default=env('LOADTEST_HOST'), help='target of the load test')
+    parser.add_argument('--users', type=int, default=int(env('LOADTEST_USERS', 100)))
+    parser.add_argument('--spawn-rate', type=int, default=int(env('LOADTEST_SPAWN_RATE', 10)))
+    parser.add_argument('--duration', type=int, default=int(env('LOADTEST_DURATION', 300)), help='seconds')
+    parser.add_argument('--workers', type=int, default=int(env('LOADTEST_WORKERS', 0)), help='workers to wait for')
+    parser.add_argument('--timeout', type=int, default=int(env('LOADTEST_TIMEOUT', 300)), help='seconds')
+    parser.add_argument('--results-dir', default=env('LOADTEST_RESULTS_DIR', 'loadtest_results'))
+    args = parser.parse_args(argv)
+    if not args.host:
+        parser.error('--host or LOADTEST_HOST is required')
+
+    print(f'Results in {run(args)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+"""
+Default load test scenario, anonymous traffic over the public pages.
+
+Scenarios run in the Locust image, they are uploaded to `s3://<stack_name>/loadtest/scenarios/`.
+"""
+from locust import HttpUser, between, task
+
+
+class AnonymousUser(HttpUser):
+    wait_time = between(1, 3)
+
+    @task
+    def home(self):
+        self.client.get('/')
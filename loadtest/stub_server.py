@@ -0,0 +1,91 @@
+"""
+Stub of the Locust master web API, to run `loadtest.runner` locally.
+
+    python -m loadtest.stub_server --port 8089 --workers 2
+
+It fakes a swarm with the request rate of the users, no request leaves the machine.
+"""
+import argparse
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+state_lock = threading.Lock()
+state = {'state': 'ready', 'user_count': 0, 'num_requests': 0}
+
+
+def get_stats(workers: int) -> dict:
+    with state_lock:
+        if state['state'] == 'running':
+            state['num_requests'] += state['user_count']
+        users, num_requests, running = state['user_count'], state['num_requests'], state['state']
+
+    response_time = round(random.uniform(20, 80), 2)
+    return {
+        'state': running,
+        'user_count': users,
+        'worker_count': workers,
+        'total_rps': float(users),
+        'fail_ratio': 0.0,
+        'stats': [{
+            'name': 'Aggregated',
+            'num_requests': num_requests,
+            'num_failures': 0,
+            'avg_response_time': response_time,
+            'max_response_time': response_time * 3,
+        }],
+        'response_time_percentile_0.5': response_time,
+        'response_time_percentile_0.95': response_time * 2,
+        'errors': [],
+    }
+
+
+class LocustMasterHandler(BaseHTTPRequestHandler):
+    workers = 0
+
+    def send_body(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats/requests':
+            self.send_body(json.dumps(get_stats(self.workers)).encode(), 'application/json')
+        elif self.path.endswith('/csv'):
+            stats = get_stats(self.workers)['stats'][0]
+            self.send_body(f'Name,Request Count\nAggregated,{stats["num_requests"]}\n'.encode(), 'text/csv')
+        elif self.path == '/stop':
+            with state_lock:
+                state.update(state='stopped', user_count=0)
+            self.send_body(b'{"success": true}', 'application/json')
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if self.path != '/swarm':
+            self.send_error(404)
+            return
+        form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        with state_lock:
+            state.update(state='running', user_count=int(form['user_count'][0]), num_requests=0)
+        self.send_body(b'{"success": true}', 'application/json')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stub of the Locust master web API')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    LocustMasterHandler.workers = args.workers
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), LocustMasterHandler)
+    print(f'Locust master stub on http://127.0.0.1:{args.port}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Publishes the length of the Celery queues in Redis as a CloudWatch metric.
+
+Inlined into a Lambda function, it only relies on the standard library and boto3 so it
+talks to Redis with a minimal RESP client (`LLEN` per queue).
+"""
+import json
+import os
+import socket
+
+import boto3
+
+cloudwatch = boto3.client('cloudwatch')
+
+
+def encode_command(*args: str) -> bytes:
+    command = f'*{len(args)}\r\n'
+    for arg in args:
+        command += f'${len(arg.encode())}\r\n{arg}\r\n'
+    return command.encode()
+
+
+def queue_length(connection: socket.socket, queue: str) -> int:
+    connection.sendall(encode_command('LLEN', queue))
+    reply = b''
+    while not reply.endswith(b'\r\n'):
+        chunk = connection.recv(64)
+        if not chunk:
+            raise ConnectionError('Redis closed the connection')
+        reply += chunk
+    if not reply.startswith(b':'):
+        raise ValueError(f'Unexpected Redis reply: {reply!r}')
+    return int(reply[1:-2])
+
+
+def handler(event, context):
+    pools = json.loads(os.environ['QUEUE_POOLS'])  # {"worker": ["celery"]}
+    address = (os.environ['REDIS_HOST'], int(os.environ['REDIS_PORT']))
+
+    with socket.create_connection(address, timeout=5) as connection:
+        lengths = {
+            pool: sum(queue_length(connection, queue) for queue in queues)
+            for pool, queues in pools.items()
+        }
+
+    cloudwatch.put_metric_data(
+        Namespace=os.environ['METRIC_NAMESPACE'],
+        MetricData=[
+            {
+                'MetricName': os.environ['METRIC_NAME'],
+                'Dimensions': [
+                    {'Name': 'StackName', 'Value': os.environ['STACK_NAME']},
+                    {'Name': 'Pool', 'Value': pool},
+                ],
+                'Value': length,
+                'Unit': 'Count',
+            }
+            for pool, length in lengths.items()
+        ],
+    )
+    return lengths
@@ -0,0 +1,156 @@
+import json
+from typing import Optional
+
+import jsii
+from aws_cdk import (
+    aws_applicationautoscaling as appscaling,
+    aws_ec2 as ec2,
+    aws_ecr as ecr,
+    aws_elasticache as elasticache,
+    aws_rds as rds,
+    core,
+)
+
+from stacks.settings import StackConfig
+
+LINT_LEVELS = ('off', 'warning', 'error')
+SUPPRESS_METADATA = 'lint:suppress'
+# below this scaling limit a traffic spike saturates the services
+MIN_MAX_CAPACITY = 10
+CPU_METRIC_TYPE = 'ECSServiceAverageCPUUtilization'
+
+
+def get_cfn_properties(node: core.CfnResource) -> dict:
+    # the resolved properties, the L1 attributes can't return the lazy values of the L2 constructs
+    return core.Stack.of(node).resolve(node._cfn_properties)
+
+
+def check_rds_public(node: core.IConstruct) -> Optional[str]:
+    if isinstance(node, rds.CfnDBInstance) and get_cfn_properties(node).get('publiclyAccessible'):
+        return 'Database in public subnets, every connection leaves the private network and it is open to the internet'
+
+
+def check_vpc_nat(node: core.IConstruct) -> Optional[str]:
+    if not isinstance(node, ec2.Vpc):
+        return None
+    nat_gateways = [child for child in node.node.find_all() if isinstance(child, ec2.CfnNatGateway)]
+    if nat_gateways and len(nat_gateways) < len(node.availability_zones):
+        return (
+            f'{len(nat_gateways)} NAT gateway(s) for {len(node.availability_zones)} availability zones, '
+            'private subnets share the bandwidth and cross AZ traffic of a single gateway'
+        )
+
+
+def check_redis_replicas(node: core.IConstruct) -> Optional[str]:
+    if isinstance(node, elasticache.CfnCacheCluster) and get_cfn_properties(node).get('engine') == 'redis':
+        return 'Redis single node cluster, no replica takes the reads or the failover'
+    if isinstance(node, elasticache.CfnReplicationGroup):
+        properties = get_cfn_properties(node)
+        if properties.get('numNodeGroups'):
+            has_replicas = bool(properties.get('replicasPerNodeGroup'))
+        else:
+            has_replicas = properties.get('numCacheClusters', 1) > 1
+        if not has_replicas:
+            return 'Redis replication group without replicas, no replica takes the reads or the failover'
+
+
+def get_scaling_policies(node: appscaling.ScalableTarget):
+    # policies and the target are children of the same scalable attribute (`TaskCount`)
+    return [
+        child for child in node.node.scope.node.find_all()
+        if isinstance(child, appscaling.CfnScalingPolicy)
+    ]
+
+
+def check_scaling_metrics(node: core.IConstruct) -> Optional[str]:
+    if not isinstance(node, appscaling.ScalableTarget):
+        return None
+    metric_types = set()
+    for policy in get_scaling_policies(node):
+        tracking = get_cfn_properties(policy).get('targetTrackingScalingPolicyConfiguration') or {}
+        metric = tracking.get('predefinedMetricSpecification') or {}
+        metric_types.add(metric.get('predefinedMetricType') or policy.node.id)
+    if metric_types == {CPU_METRIC_TYPE}:
+        return 'Scaling on CPU only, I/O bound requests and queue backlogs do not scale the service'
+
+
+def check_scaling_capacity(node: core.IConstruct) -> Optional[str]:
+    if not isinstance(node, appscaling.ScalableTarget):
+        return None
+    max_capacity = get_cfn_properties(node.node.default_child)['maxCapacity']
+    if max_capacity <= MIN_MAX_CAPACITY:
+        return f'Scaling capped at {max_capacity} tasks'
+
+
+def check_ecr_expiry(node: core.IConstruct) -> Optional[str]:
+    if not isinstance(node, ecr.CfnRepository):
+        return None
+    lifecycle_policy = get_cfn_properties(node).get('lifecyclePolicy') or {}
+    policy_text = json.loads(lifecycle_policy.get('lifecyclePolicyText') or '{}')
+    for rule in policy_text.get('rules', []):
+        if rule.get('selection', {}).get('countType') == 'sinceImagePushed':
+            return (
+                'Images expire by age, tasks still running an old image fail to pull it when they scale out, '
+                'keep a number of images instead'
+            )
+
+
+RULES = {
+    'rds-public-subnets': check_rds_public,
+    'vpc-single-nat': check_vpc_nat,
+    'redis-no-replicas': check_redis_replicas,
+    'scaling-cpu-only': check_scaling_metrics,
+    'scaling-capped': check_scaling_capacity,
+    'ecr-image-expiry': check_ecr_expiry,
+}
+
+
+def suppress_rule(construct: core.IConstruct, rule_id: str, reason: str):
+    """Skips a rule for the construct and its children."""
+    if rule_id not in RULES:
+        raise ValueError(f'Unknown lint rule {rule_id}')
+    construct.node.add_metadata(f'{SUPPRESS_METADATA}:{rule_id}', reason)
+
+
+def is_suppressed(node: core.IConstruct, rule_id: str) -> bool:
+    for scope in node.node.scopes:
+        for entry in scope.node.metadata:
+            if entry.type == f'{SUPPRESS_METADATA}:{rule_id}':
+                return True
+    return False
+
+
+@jsii.implements(core.IAspect)
+class PerformanceRules(object):
+    def __init__(self, config: StackConfig, strict: bool = False):
+        rule_levels = config.lint_rules or {}
+        for rule_id, level in rule_levels.items():
+            if rule_id not in RULES:
+                raise ValueError(f'Unknown lint rule {rule_id} in lint_rules of {config.stack_name}')
+            if level not in LINT_LEVELS:
+                raise ValueError(f'Invalid level {level} of lint rule {rule_id}, choices: {", ".join(LINT_LEVELS)}')
+
+        default_level = 'error' if strict or config.lint_strict else 'warning'
+        suppressions = config.lint_suppressions or {}
+        self.levels = {
+            rule_id: 'off' if rule_id in suppressions else rule_levels.get(rule_id, default_level)
+            for rule_id in RULES
+        }
+
+    def visit(self, node: core.IConstruct):
+        for rule_id, check in RULES.items():
+            level = self.levels[rule_id]
+            if level == 'off':
+                continue
+            message = check(node)
+            if not message or is_suppressed(node, rule_id):
+                continue
+            if level == 'error':
+                core.Annotations.of(node).add_error(f'[{rule_id}] {message}')
+            else:
+                core.Annotations.of(node).add_warning(f'[{rule_id}] {message}')
+
+
+def add_lint_rules(stack: core.Stack, config: StackConfig):
+    strict = str(stack.node.try_get_context('lint_strict') or '').lower() == 'true'
+    core.Aspects.of(stack).add(PerformanceRules(config, strict))
@@ -1,25 +1,112 @@
 
+import string
+
 from aws_cdk import (
+    aws_applicationautoscaling as appscaling,
+    aws_cloudwatch as cloudwatch,
     aws_ecs as ecs,
     aws_ec2 as ec2,
     aws_ecr as ecr,
     aws_iam as iam,
     aws_s3 as s3,
     aws_logs as logs,
+    aws_elasticloadbalancingv2 as elbv2,
     core,
 )
 from aws_cdk.aws_ec2 import IVpc
 
 from stacks.settings import StackConfig
 
+# Memory (MiB) allowed by Fargate for each task CPU size
+FARGATE_TASK_SIZES = {
+    256: [512, 1024, 2048],
+    512: list(range(1024, 4096 + 1, 1024)),
+    1024: list(range(2048, 8192 + 1, 1024)),
+    2048: list(range(4096, 16384 + 1, 1024)),
+    4096: list(range(8192, 30720 + 1, 1024)),
+    8192: list(range(16384, 61440 + 1, 4096)),
+    16384: list(range(32768, 122880 + 1, 8192)),
+}
+FARGATE_EPHEMERAL_STORAGE_GIB = (21, 200)
+
+APP_PORT = 8000
+# minutes of empty queue before the workers scale in, and the wait between scale ins
+QUEUE_SCALE_IN_MINUTES = 10
+QUEUE_SCALE_IN_COOLDOWN = core.Duration.minutes(5)
+# name of the app port mapping, Service Connect refers to it
+APP_PORT_NAME = 'http'
+
+DATADOG_SOCKETS_VOLUME = 'datadog-sockets'
+DATADOG_SOCKETS_DIR = '/var/run/datadog'
+DATADOG_LOGS_HOST = 'http-intake.logs.datadoghq.com'
+
+LOG_ROUTER_DESTINATIONS = ('cloudwatch', 's3', 'datadog')
+LOG_ROUTER_CONFIG_FILE = '/tmp/extra.conf'
+# keeps one of every `rate` records whose log contains the `pattern` text (plain find, no Lua pattern)
+LOG_SAMPLE_LUA = string.Template(
+    'local count = 0 '
+    'function sample(tag, timestamp, record) '
+    'if record["log"] and string.find(record["log"], ${pattern}, 1, true) then '
+    'count = count + 1 '
+    'if count % ${rate} ~= 0 then return -1, timestamp, record end '
+    'end '
+    'return 0, timestamp, record '
+    'end'
+)
+
 
-def create_cluster(scope: core.Construct, stack_name: str, vpc: IVpc):
-    return ecs.Cluster(
+def get_namespace_name(stack_name: str) -> str:
+    return f'{stack_name}.local'
+
+
+def get_internal_environment(stack_name: str, roles: list) -> dict:
+    """`<ROLE>_INTERNAL_URL` of the services reachable inside the VPC, same names with or without Service Connect."""
+    return {
+        f'{role.upper().replace("-", "_")}_INTERNAL_URL': f'http://{role}.{get_namespace_name(stack_name)}:{APP_PORT}'
+        for role in roles
+    }
+
+
+def create_cluster(
+    scope: core.Construct,
+    stack_name: str,
+    vpc: IVpc,
+    cloud_map_namespace: bool = False,
+    service_connect: bool = False,
+):
+    cluster = ecs.Cluster(
         scope, 'cluster',
         cluster_name=stack_name,
         vpc=vpc,
         container_insights=True,
     )
+    # CDK 1.68 has no props for Fargate capacity providers
+    cluster.node.default_child.capacity_providers = ['FARGATE', 'FARGATE_SPOT']
+
+    if cloud_map_namespace or service_connect:
+        # private DNS namespace, the calls between services stay in the VPC
+        namespace = cluster.add_default_cloud_map_namespace(name=get_namespace_name(stack_name))
+        if service_connect:
+            cluster.node.default_child.add_property_override(
+                'ServiceConnectDefaults', {'Namespace': namespace.namespace_arn}
+            )
+    return cluster
+
+
+def get_capacity_provider_strategy(on_demand_base: int, on_demand_weight: int, spot_weight: int):
+    if not spot_weight:
+        return None
+    return [
+        ecs.CfnService.CapacityProviderStrategyItemProperty(
+            capacity_provider='FARGATE',
+            base=on_demand_base,
+            weight=on_demand_weight,
+        ),
+        ecs.CfnService.CapacityProviderStrategyItemProperty(
+            capacity_provider='FARGATE_SPOT',
+            weight=spot_weight,
+        ),
+    ]
 
 
 def create_services_policy(scope: core.Construct, stack_name: str, kms_key: str):
@@ -60,6 +147,155 @@ def create_services_policy(scope: core.Construct, stack_name: str, kms_key: str)
     return policy
 
 
+def validate_task_size(cpu: int, memory: int, ephemeral_storage: int = None):
+    if cpu not in FARGATE_TASK_SIZES:
+        raise ValueError(f'Invalid Fargate CPU {cpu}, choices: {list(FARGATE_TASK_SIZES)}')
+    if memory not in FARGATE_TASK_SIZES[cpu]:
+        raise ValueError(f'Invalid Fargate memory {memory} for CPU {cpu}, choices: {FARGATE_TASK_SIZES[cpu]}')
+
+    min_storage, max_storage = FARGATE_EPHEMERAL_STORAGE_GIB
+    if ephemeral_storage is not None and not min_storage <= ephemeral_storage <= max_storage:
+        raise ValueError(f'Invalid Fargate ephemeral storage {ephemeral_storage}, range: {min_storage}-{max_storage} GiB')
+
+
+class NonBlockingAwsLogDriver(ecs.LogDriver):
+    """awslogs in non-blocking mode, the option isn't in this CDK version."""
+
+    def __init__(self, stream_prefix: str, log_group: logs.LogGroup, max_buffer_size: str):
+        super().__init__()
+        self.aws_logs = ecs.LogDrivers.aws_logs(stream_prefix=stream_prefix, log_group=log_group)
+        self.max_buffer_size = max_buffer_size
+
+    def bind(self, scope: core.Construct, container_definition: ecs.ContainerDefinition) -> ecs.LogDriverConfig:
+        log_config = self.aws_logs.bind(scope, container_definition)
+        return ecs.LogDriverConfig(
+            log_driver=log_config.log_driver,
+            options={
+                **log_config.options,
+                # a full buffer drops lines instead of blocking stdout writes
+                'mode': 'non-blocking',
+                'max-buffer-size': self.max_buffer_size,
+            },
+        )
+
+
+def lua_quote(value: str) -> str:
+    """Lua string literal of `value`, the bytes outside printable ASCII as decimal escapes."""
+    characters = []
+    for byte in value.encode():
+        if chr(byte) in '"\\':
+            characters.append('\\' + chr(byte))
+        elif 32 <= byte < 127:
+            characters.append(chr(byte))
+        else:
+            characters.append(f'\\{byte:03d}')
+    return '"' + ''.join(characters) + '"'
+
+
+def get_log_router_config(config: StackConfig) -> str:
+    """Fluent Bit settings added to the FireLens generated configuration."""
+    sections = [
+        # records are sent in batches every flush instead of a PutLogEvents per line
+        f'[SERVICE]\n    Flush {config.log_flush_seconds}\n    Grace 30\n',
+    ]
+    if config.log_exclude_pattern:
+        sections.append(f'[FILTER]\n    Name grep\n    Match *\n    Exclude log {config.log_exclude_pattern}\n')
+    if config.log_sample_pattern:
+        rate = config.log_sample_rate
+        if not isinstance(rate, int) or isinstance(rate, bool) or rate < 1:
+            raise ValueError(f'log_sample_rate of {config.stack_name} must be an integer of 1 or more, not {rate}')
+        code = LOG_SAMPLE_LUA.substitute(pattern=lua_quote(config.log_sample_pattern), rate=rate)
+        sections.append(f'[FILTER]\n    Name lua\n    Match *\n    call sample\n    code {code}\n')
+    return '\n'.join(sections)
+
+
+def get_log_driver(
+    scope: core.Construct,
+    task_definition: ecs.TaskDefinition,
+    log_group: logs.LogGroup,
+    stream_prefix: str,
+    config: StackConfig,
+    role: str = None,
+    log_bucket: s3.Bucket = None,
+):
+    if not config.log_router:
+        if not config.log_non_blocking:
+            return ecs.LogDrivers.aws_logs(stream_prefix=stream_prefix, log_group=log_group)
+
+        return NonBlockingAwsLogDriver(
+            stream_prefix=stream_prefix,
+            log_group=log_group,
+            max_buffer_size=config.log_max_buffer_size,
+        )
+
+    if config.log_router == 'cloudwatch':
+        log_group.grant_write(task_definition.task_role)
+        options = {
+            'Name': 'cloudwatch_logs',
+            'region': scope.region,
+            'log_group_name': log_group.log_group_name,
+            'log_stream_prefix': f'{stream_prefix}/',
+            'auto_create_group': 'false',
+        }
+    elif config.log_router == 's3':
+        log_bucket.grant_put(task_definition.task_role)
+        options = {
+            'Name': 's3',
+            'region': scope.region,
+            'bucket': log_bucket.bucket_name,
+            'total_file_size': '50M',
+            'upload_timeout': '5m',
+            'compression': 'gzip',
+            's3_key_format': f'/{stream_prefix}/%Y/%m/%d/%H/$UUID.gz',
+        }
+    else:
+        options = {
+            'Name': 'datadog',
+            'Host': DATADOG_LOGS_HOST,
+            'TLS': 'on',
+            'apikey': config.datadog_api_key,
+            'provider': 'ecs',
+            'dd_service': role or stream_prefix,
+            'dd_source': 'datadog-agent' if role == 'datadog-agent' else 'python',
+            'dd_tags': f'env:{config.stack_label}',
+        }
+    if config.log_buffer_limit:
+        # log events the FireLens driver keeps in memory while the router is busy
+        options['log-driver-buffer-limit'] = str(config.log_buffer_limit)
+    return ecs.LogDrivers.firelens(options=options)
+
+
+def add_log_router(
+    task_definition: ecs.TaskDefinition,
+    log_group: logs.LogGroup,
+    service_name: str,
+    config: StackConfig,
+):
+    return task_definition.add_firelens_log_router(
+        'log-router',
+        image=ecs.ContainerImage.from_registry(config.log_router_image),
+        cpu=config.log_router_cpu,
+        memory_limit_mib=config.log_router_memory,
+        essential=True,
+        firelens_config=ecs.FirelensConfig(
+            type=ecs.FirelensLogRouterType.FLUENTBIT,
+            options=ecs.FirelensOptions(
+                config_file_type=ecs.FirelensConfigFileType.FILE,
+                config_file_value=LOG_ROUTER_CONFIG_FILE,
+                enable_ecs_log_metadata=True,
+            ),
+        ),
+        # the extra configuration goes in the environment, no custom image needed
+        environment={'FLUENT_BIT_EXTRA_CONF': get_log_router_config(config)},
+        entry_point=['sh', '-c'],
+        command=[f'printf "%s\\n" "$FLUENT_BIT_EXTRA_CONF" > {LOG_ROUTER_CONFIG_FILE} && exec /entrypoint.sh'],
+        logging=ecs.LogDrivers.aws_logs(
+            stream_prefix=f'{service_name}-log-router',
+            log_group=log_group,
+        ),
+    )
+
+
 def create_task_definition(
     scope: core.Construct,
     ecr_repository: ecr.Repository,
@@ -71,25 +307,67 @@ def create_task_definition(
     config: StackConfig,
     role: str = None,
     command: list = None,
+    cpu: int = 512,
+    memory: int = 1024,
+    ephemeral_storage: int = None,
+    environment: dict = None,
+    log_bucket: s3.Bucket = None,
 ):
+    validate_task_size(cpu, memory, ephemeral_storage)
+    if config.log_router and config.log_router not in LOG_ROUTER_DESTINATIONS:
+        raise ValueError(f'log_router of {service_name} must be one of {", ".join(LOG_ROUTER_DESTINATIONS)}')
+    if config.log_router == 'datadog' and not config.datadog_api_key:
+        raise ValueError(f'log_router datadog of {service_name} needs datadog_api_key')
+    if config.log_router and config.log_non_blocking:
+        raise ValueError(f'log_non_blocking of {service_name} applies to awslogs, not to a log_router')
+
+    # sidecars are reserved out of the task budget, the app container reserves the rest
+    sidecar_cpu, sidecar_memory = 0, 0
+    if config.datadog_api_key:
+        sidecar_cpu += config.datadog_cpu
+        sidecar_memory += config.datadog_memory
+    if config.log_router:
+        sidecar_cpu += config.log_router_cpu
+        sidecar_memory += config.log_router_memory
+    if sidecar_cpu >= cpu or sidecar_memory >= memory:
+        raise ValueError(f'Sidecars of {service_name} need the whole task, cpu: {sidecar_cpu} memory: {sidecar_memory}')
+
     task_definition = ecs.FargateTaskDefinition(
         scope, f'TaskDefinition-{role}',
-        cpu=512,
-        memory_limit_mib=1024,
+        cpu=cpu,
+        memory_limit_mib=memory,
         family=service_name,
     )
+    if ephemeral_storage:
+        task_definition.node.default_child.add_property_override(
+            'EphemeralStorage', {'SizeInGiB': ephemeral_storage}
+        )
 
     container_props = dict()
     if command:
         container_props['command'] = command
 
+    use_datadog_sockets = config.datadog_api_key and config.datadog_sockets
+    if use_datadog_sockets:
+        # unix sockets in a shared volume, statsd packets are not dropped like over UDP
+        task_definition.add_volume(name=DATADOG_SOCKETS_VOLUME)
+        datadog_environment = {
+            'DD_TRACE_AGENT_URL': f'unix://{DATADOG_SOCKETS_DIR}/apm.socket',
+            'DD_DOGSTATSD_URL': f'unix://{DATADOG_SOCKETS_DIR}/dsd.socket',
+        }
+    else:
+        datadog_environment = {
+            'DD_AGENT_HOST': '0.0.0.0',
+            'DD_TRACE_AGENT_PORT': '8126',
+        }
+
     app_container = task_definition.add_container(
         'container',
         image=ecs.ContainerImage.from_ecr_repository(ecr_repository),
-        logging=ecs.LogDrivers.aws_logs(
-            stream_prefix=service_name,
-            log_group=log_group
-        ),
+        cpu=cpu - sidecar_cpu,
+        # soft limit, the app can burst into the unused memory of the task instead of being killed
+        memory_reservation_mib=memory - sidecar_memory,
+        logging=get_log_driver(scope, task_definition, log_group, service_name, config, role, log_bucket),
         environment={
             'AWS_REGION': scope.region,
             'DD_ENV': config.stack_label,
@@ -98,27 +376,35 @@ def create_task_definition(
             'DD_VERSION': '1',  # TODO calculate in the building
             'STACK_NAME': stack_name,
             'DD_APM_ENABLED': 'true',
-            'DD_AGENT_HOST': '0.0.0.0',
-            'DD_TRACE_AGENT_PORT': '8126',
+            **datadog_environment,
+            **(environment or {}),
         },
         **container_props,
     )
-    app_container.add_port_mappings(ecs.PortMapping(container_port=8000))
+    app_container.add_port_mappings(ecs.PortMapping(container_port=APP_PORT))
+    if config.service_connect:
+        # CDK 1.68 has no port mapping names, the app container and its port come first
+        task_definition.node.default_child.add_property_override(
+            'ContainerDefinitions.0.PortMappings.0.Name', APP_PORT_NAME
+        )
     task_definition.task_role.attach_inline_policy(policy)
 
+    # after the app container, the default container of the load balancer targets
+    log_router = None
+    if config.log_router:
+        log_router = add_log_router(task_definition, log_group, service_name, config)
+
     #
     #  D A T A D O G
     #
+    datadog_container = None
     if config.datadog_api_key:
         datadog_container = task_definition.add_container(
             'datadog-agent',
-            image=ecs.ContainerImage.from_registry('datadog/agent:latest'),
-            memory_limit_mib=256,
-            cpu=12,
-            logging=ecs.LogDrivers.aws_logs(
-                stream_prefix=stack_name,
-                log_group=log_group
-            ),
+            image=ecs.ContainerImage.from_registry(config.datadog_agent_image),
+            memory_limit_mib=config.datadog_memory,
+            cpu=config.datadog_cpu,
+            logging=get_log_driver(scope, task_definition, log_group, stack_name, config, 'datadog-agent', log_bucket),
             environment={
                 'AWS_REGION': scope.region,
                 'DD_API_KEY': config.datadog_api_key,
@@ -128,15 +414,54 @@ def create_task_definition(
                 'DD_DOGSTATSD_NON_LOCAL_TRAFFIC': 'true',
                 'DD_DOGSTATSD_PORT': '8125',
                 'ECS_FARGATE': 'true',
+                **({
+                    'DD_APM_RECEIVER_SOCKET': f'{DATADOG_SOCKETS_DIR}/apm.socket',
+                    'DD_DOGSTATSD_SOCKET': f'{DATADOG_SOCKETS_DIR}/dsd.socket',
+                } if use_datadog_sockets else {}),
             },
+            health_check=ecs.HealthCheck(
+                command=['CMD-SHELL', 'agent health'],
+                interval=core.Duration.seconds(10),
+                retries=3,
+                start_period=core.Duration.seconds(15),
+                timeout=core.Duration.seconds(5),
+            ) if use_datadog_sockets else None,
         )
-        datadog_container.add_port_mappings(
-            ecs.PortMapping(container_port=8126, protocol=ecs.Protocol.TCP)
-        )
-        datadog_container.add_port_mappings(
-            ecs.PortMapping(container_port=8125, protocol=ecs.Protocol.UDP)
+        if use_datadog_sockets:
+            for container in (app_container, datadog_container):
+                container.add_mount_points(
+                    ecs.MountPoint(
+                        container_path=DATADOG_SOCKETS_DIR,
+                        source_volume=DATADOG_SOCKETS_VOLUME,
+                        read_only=False,
+                    )
+                )
+        else:
+            datadog_container.add_port_mappings(
+                ecs.PortMapping(container_port=8126, protocol=ecs.Protocol.TCP)
+            )
+            datadog_container.add_port_mappings(
+                ecs.PortMapping(container_port=8125, protocol=ecs.Protocol.UDP)
+            )
+
+        # the sockets exist once the agent is healthy, over TCP/UDP a failing agent must not hold the app back
+        app_container.add_container_dependencies(
+            ecs.ContainerDependency(
+                container=datadog_container,
+                condition=(
+                    ecs.ContainerDependencyCondition.HEALTHY if use_datadog_sockets
+                    else ecs.ContainerDependencyCondition.START
+                ),
+            )
         )
 
+    if log_router:
+        for container in app_container, datadog_container:
+            if container:
+                container.add_container_dependencies(
+                    ecs.ContainerDependency(container=log_router, condition=ecs.ContainerDependencyCondition.START)
+                )
+
     task_definition.task_role.attach_inline_policy(policy)
     s3_bucket.grant_read_write(task_definition.task_role)
     return task_definition
@@ -150,11 +475,28 @@ def create_fargate_service(
     desired_count: int,
     role: str,
     has_health_check: bool = False,
+    capacity_provider_strategy: list = None,
+    lazy_loading: bool = False,
+    cloud_map_options: ecs.CloudMapOptions = None,
+    discoverable: bool = False,
+    service_connect: bool = False,
 ):
+    """
+    `discoverable` publishes the service as `<role>.<namespace>` (see `get_internal_environment`), through
+    Service Connect when `service_connect` or a Cloud Map record otherwise.
+    """
+    namespace = ecs_cluster.default_cloud_map_namespace
+    if (discoverable or service_connect) and not namespace:
+        raise ValueError(f'Service discovery of {service_name} needs a Cloud Map namespace on the cluster')
 
     service_props = dict()
+    if discoverable and not service_connect and not cloud_map_options:
+        cloud_map_options = ecs.CloudMapOptions(name=role)
     if has_health_check:
         service_props['health_check_grace_period'] = core.Duration.seconds(10)
+    if lazy_loading:
+        # SOCI indexes are only used by platform version 1.4.0
+        service_props['platform_version'] = ecs.FargatePlatformVersion.VERSION1_4
 
     service = ecs.FargateService(
         scope, f'service-{role}',
@@ -166,17 +508,110 @@ def create_fargate_service(
         max_healthy_percent=200,  # it makes zero downtime deployment
         min_healthy_percent=0,
         vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE),
+        cloud_map_options=cloud_map_options,
         **service_props,
     )
+    if capacity_provider_strategy:
+        # a capacity provider strategy replaces the launch type
+        cfn_service = service.node.find_child('Service')
+        cfn_service.capacity_provider_strategy = capacity_provider_strategy
+        cfn_service.add_property_deletion_override('LaunchType')
+    if service_connect:
+        # CDK 1.68 predates Service Connect, every service is a client, the discoverable ones a server too
+        service_connect_configuration = {'Enabled': True, 'Namespace': namespace.namespace_arn}
+        if discoverable:
+            service_connect_configuration['Services'] = [{
+                'PortName': APP_PORT_NAME,
+                'DiscoveryName': role,
+                'ClientAliases': [{'Port': APP_PORT, 'DnsName': f'{role}.{namespace.namespace_name}'}],
+            }]
+        service.node.find_child('Service').add_property_override(
+            'ServiceConnectConfiguration', service_connect_configuration
+        )
+    return service
+
+
+def create_service_scaling(
+    service: ecs.FargateService,
+    min_capacity: int,
+    max_capacity: int,
+    cpu_scaling: bool = True,
+):
     scaling = service.auto_scale_task_count(
-        min_capacity=desired_count,
-        max_capacity=10,
-    )
-    scaling.scale_on_cpu_utilization(
-        'CpuScaling',
-        target_utilization_percent=50,
-        scale_in_cooldown=core.Duration.seconds(60),
-        scale_out_cooldown=core.Duration.seconds(60),
+        min_capacity=min_capacity,
+        max_capacity=max_capacity,
     )
-    return service
+    if cpu_scaling:
+        scaling.scale_on_cpu_utilization(
+            'CpuScaling',
+            target_utilization_percent=50,
+            scale_in_cooldown=core.Duration.seconds(60),
+            scale_out_cooldown=core.Duration.seconds(60),
+        )
+    return scaling
+
 
+def configure_app_scaling(
+    scaling: ecs.ScalableTaskCount,
+    target_group: elbv2.ApplicationTargetGroup,
+    config: StackConfig,
+):
+    # CPU lags behind the load of I/O bound apps, track the load balancer too
+    if config.app_requests_per_target:
+        scaling.scale_on_request_count(
+            'RequestScaling',
+            requests_per_target=config.app_requests_per_target,
+            target_group=target_group,
+            scale_in_cooldown=core.Duration.seconds(120),
+            scale_out_cooldown=core.Duration.seconds(30),
+        )
+    if config.app_target_response_time:
+        scaling.scale_to_track_custom_metric(
+            'LatencyScaling',
+            metric=target_group.metric_target_response_time(
+                period=core.Duration.minutes(1),
+                statistic='Average',
+            ),
+            target_value=config.app_target_response_time,
+            scale_in_cooldown=core.Duration.seconds(120),
+            scale_out_cooldown=core.Duration.seconds(30),
+        )
+
+    # e.g. {"name": "business-hours", "schedule": "cron(0 8 ? * MON-FRI *)", "min_count": 4}
+    for schedule in config.app_scaling_schedules or []:
+        scaling.scale_on_schedule(
+            schedule['name'],
+            schedule=appscaling.Schedule.expression(schedule['schedule']),
+            min_capacity=schedule.get('min_count'),
+            max_capacity=schedule.get('max_count'),
+        )
+
+
+def configure_queue_scaling(
+    scaling: ecs.ScalableTaskCount,
+    queue_length: cloudwatch.IMetric,
+    min_capacity: int,
+    max_capacity: int,
+    threshold: int,
+):
+    # from zero tasks the first message starts a worker, it would wait for `threshold` messages otherwise
+    scale_out_threshold = 1 if min_capacity == 0 else threshold
+    scaling.scale_on_metric(
+        'QueueScaling',
+        metric=queue_length,
+        scaling_steps=[
+            # empty queue: back to the minimum capacity (zero when enabled)
+            appscaling.ScalingInterval(upper=0, change=-max_capacity),
+            appscaling.ScalingInterval(lower=scale_out_threshold, change=1),
+            appscaling.ScalingInterval(lower=threshold * 5, change=3),
+        ],
+        adjustment_type=appscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+        cooldown=core.Duration.seconds(60),
+    )
+    # an empty queue doesn't mean idle workers, they still run the messages they pulled off the queue
+    # the policies are children of the scalable target
+    policy = scaling.node.find_child('Target').node.find_child('QueueScaling')
+    policy.node.find_child('LowerAlarm').node.default_child.evaluation_periods = QUEUE_SCALE_IN_MINUTES
+    policy.node.find_child('LowerPolicy').node.default_child.add_property_override(
+        'StepScalingPolicyConfiguration.Cooldown', QUEUE_SCALE_IN_COOLDOWN.to_seconds()
+    )
@@ -0,0 +1,229 @@
+from aws_cdk import (
+    aws_ec2 as ec2,
+    aws_ecs as ecs,
+    aws_iam as iam,
+    aws_logs as logs,
+    aws_s3 as s3,
+    core,
+)
+
+from stacks.lint import suppress_rule
+from stacks.resources.ecs_services import (
+    create_fargate_service,
+    create_service_scaling,
+    get_namespace_name,
+    validate_task_size,
+)
+from stacks.resources.network import get_origin_domain_name
+from stacks.settings import StackConfig
+
+AWS_CLI_IMAGE = 'amazon/aws-cli:2.15.0'
+LOCUST_MASTER_NAME = 'locust-master'
+LOCUST_WORKER_NAME = 'locust-worker'
+LOCUST_WEB_PORT = 8089
+LOCUST_MASTER_PORT = 5557
+LOADTEST_PREFIX = 'loadtest'
+LOADTEST_VOLUME = 'loadtest'
+LOADTEST_DIR = '/mnt/loadtest'
+LOCUST_MASTER_CPU = 1024
+LOCUST_MASTER_MEMORY = 2048
+
+
+def get_load_test_host(config: StackConfig) -> str:
+    if config.load_test_host:
+        return config.load_test_host
+    # straight to the load balancer, CloudFront would cache or throttle the generated traffic
+    if config.cdn_enabled:
+        return f'https://{get_origin_domain_name(config)}'
+    return f'https://{config.dns_stack_subdomain}.{config.dns_name}'
+
+
+def create_load_test_task_definition(
+    scope: core.Construct,
+    stack_name: str,
+    role: str,
+    s3_bucket: s3.Bucket,
+    log_group: logs.LogGroup,
+    cpu: int,
+    memory: int,
+):
+    """Task definition with the `loadtest/` files of the bucket (runner and scenarios) in a volume."""
+    validate_task_size(cpu, memory)
+    task_definition = ecs.FargateTaskDefinition(
+        scope, f'TaskDefinition-{role}',
+        cpu=cpu,
+        memory_limit_mib=memory,
+        family=f'{stack_name}-{role}',
+    )
+    task_definition.add_volume(name=LOADTEST_VOLUME)
+    s3_bucket.grant_read(task_definition.task_role, f'{LOADTEST_PREFIX}/*')
+
+    files_container = task_definition.add_container(
+        'loadtest-files',
+        image=ecs.ContainerImage.from_registry(AWS_CLI_IMAGE),
+        command=[
+            's3', 'cp', f's3://{s3_bucket.bucket_name}/{LOADTEST_PREFIX}/', f'{LOADTEST_DIR}/',
+            '--recursive', '--exclude', 'results/*',
+        ],
+        essential=False,
+        memory_reservation_mib=128,
+        logging=ecs.LogDrivers.aws_logs(stream_prefix=f'{stack_name}-{role}', log_group=log_group),
+    )
+    files_container.add_mount_points(
+        ecs.MountPoint(container_path=LOADTEST_DIR, source_volume=LOADTEST_VOLUME, read_only=False)
+    )
+    return task_definition, files_container
+
+
+def add_load_test_container(
+    task_definition: ecs.TaskDefinition,
+    name: str,
+    image: str,
+    log_group: logs.LogGroup,
+    stream_prefix: str,
+    depends_on: ecs.ContainerDefinition,
+    condition: ecs.ContainerDependencyCondition = ecs.ContainerDependencyCondition.SUCCESS,
+    **container_props,
+):
+    container = task_definition.add_container(
+        name,
+        image=ecs.ContainerImage.from_registry(image),
+        logging=ecs.LogDrivers.aws_logs(stream_prefix=stream_prefix, log_group=log_group),
+        **container_props,
+    )
+    container.add_mount_points(
+        ecs.MountPoint(container_path=LOADTEST_DIR, source_volume=LOADTEST_VOLUME, read_only=False)
+    )
+    container.add_container_dependencies(ecs.ContainerDependency(container=depends_on, condition=condition))
+    return container
+
+
+def get_update_service_command(cluster_name: str, service_name: str, desired_count) -> str:
+    return (
+        f'aws ecs update-service --cluster {cluster_name} --service {service_name} '
+        f'--desired-count {desired_count} > /dev/null'
+    )
+
+
+def create_load_test(
+    scope: core.Construct,
+    stack_name: str,
+    ecs_cluster: ecs.Cluster,
+    s3_bucket: s3.Bucket,
+    log_group: logs.LogGroup,
+    config: StackConfig,
+):
+    """
+    Locust master and an autoscaled service of workers on the stack cluster, both at zero tasks between
+    load tests. Starting the master runs the load test once: the workers are scaled up, the runner drives the
+    master, then the results are uploaded to `s3://<bucket>/loadtest/results/` and both services are scaled
+    back to zero.
+    """
+    scenario = f'{LOADTEST_DIR}/scenarios/{config.load_test_scenario}'
+    stream_prefix = f'{stack_name}-loadtest'
+    if not ecs_cluster.default_cloud_map_namespace:
+        ecs_cluster.add_default_cloud_map_namespace(name=get_namespace_name(stack_name))
+    master_host = f'{LOCUST_MASTER_NAME}.{ecs_cluster.default_cloud_map_namespace.namespace_name}'
+    master_service_name = f'{stack_name}-{LOCUST_MASTER_NAME}'
+    worker_service_name = f'{stack_name}-{LOCUST_WORKER_NAME}'
+
+    #  MASTER: locust, workers scale up, runner, results upload and scale down
+    master_task_definition, master_files = create_load_test_task_definition(
+        scope, stack_name, LOCUST_MASTER_NAME, s3_bucket, log_group, LOCUST_MASTER_CPU, LOCUST_MASTER_MEMORY,
+    )
+    s3_bucket.grant_put(master_task_definition.task_role, f'{LOADTEST_PREFIX}/results/*')
+    # service ARNs from their names, the services depend on the task definition
+    master_task_definition.add_to_task_role_policy(iam.PolicyStatement(
+        actions=['ecs:UpdateService'],
+        resources=[
+            core.Stack.of(scope).format_arn(
+                service='ecs', resource='service', resource_name=f'{ecs_cluster.cluster_name}/{name}',
+            )
+            for name in (master_service_name, worker_service_name)
+        ],
+    ))
+    master = add_load_test_container(
+        master_task_definition, 'locust', config.load_test_image, log_group, stream_prefix, master_files,
+        command=['-f', scenario, '--master', '--web-port', str(LOCUST_WEB_PORT)],
+    )
+    master.add_port_mappings(
+        ecs.PortMapping(container_port=LOCUST_WEB_PORT),
+        ecs.PortMapping(container_port=LOCUST_MASTER_PORT),
+    )
+    scale_up = add_load_test_container(
+        master_task_definition, 'scale-up', AWS_CLI_IMAGE, log_group, stream_prefix, master,
+        condition=ecs.ContainerDependencyCondition.START,
+        essential=False,
+        memory_reservation_mib=128,
+        entry_point=['sh', '-c'],
+        command=[get_update_service_command(ecs_cluster.cluster_name, worker_service_name, config.load_test_workers)],
+    )
+    runner = add_load_test_container(
+        master_task_definition, 'runner', config.load_test_image, log_group, stream_prefix, scale_up,
+        # without workers the runner times out, the results container still scales everything down
+        condition=ecs.ContainerDependencyCondition.COMPLETE,
+        essential=False,
+        entry_point=['python'],
+        command=[f'{LOADTEST_DIR}/runner.py'],
+        environment={
+            'LOCUST_MASTER_URL': f'http://localhost:{LOCUST_WEB_PORT}',
+            'LOADTEST_HOST': get_load_test_host(config),
+            'LOADTEST_USERS': str(config.load_test_users),
+            'LOADTEST_SPAWN_RATE': str(config.load_test_spawn_rate),
+            'LOADTEST_DURATION': str(config.load_test_duration),
+            'LOADTEST_WORKERS': str(config.load_test_workers),
+            'LOADTEST_RESULTS_DIR': f'{LOADTEST_DIR}/results',
+        },
+    )
+    runner.add_container_dependencies(
+        ecs.ContainerDependency(container=master, condition=ecs.ContainerDependencyCondition.START)
+    )
+    # after a failed run too, whatever was written is uploaded and both services are scaled down
+    add_load_test_container(
+        master_task_definition, 'results', AWS_CLI_IMAGE, log_group, stream_prefix, runner,
+        condition=ecs.ContainerDependencyCondition.COMPLETE,
+        essential=False,
+        memory_reservation_mib=128,
+        entry_point=['sh', '-c'],
+        command=[
+            f'aws s3 cp {LOADTEST_DIR}/results/ s3://{s3_bucket.bucket_name}/{LOADTEST_PREFIX}/results/ --recursive; '
+            f'{get_update_service_command(ecs_cluster.cluster_name, worker_service_name, 0)}; '
+            f'{get_update_service_command(ecs_cluster.cluster_name, master_service_name, 0)}',
+        ],
+    )
+    master_service = create_fargate_service(
+        scope=scope,
+        service_name=master_service_name,
+        ecs_cluster=ecs_cluster,
+        task_definition=master_task_definition,
+        desired_count=0,
+        role=LOCUST_MASTER_NAME,
+        cloud_map_options=ecs.CloudMapOptions(name=LOCUST_MASTER_NAME),
+    )
+
+    #  WORKERS: the load generators
+    worker_task_definition, worker_files = create_load_test_task_definition(
+        scope, stack_name, LOCUST_WORKER_NAME, s3_bucket, log_group, config.load_test_cpu, config.load_test_memory,
+    )
+    add_load_test_container(
+        worker_task_definition, 'locust', config.load_test_image, log_group, stream_prefix, worker_files,
+        command=['-f', scenario, '--worker', '--master-host', master_host, '--master-port', str(LOCUST_MASTER_PORT)],
+    )
+    worker_service = create_fargate_service(
+        scope=scope,
+        service_name=worker_service_name,
+        ecs_cluster=ecs_cluster,
+        task_definition=worker_task_definition,
+        desired_count=0,
+        role=LOCUST_WORKER_NAME,
+    )
+    create_service_scaling(
+        service=worker_service,
+        min_capacity=0,
+        max_capacity=max(config.load_test_max_workers, config.load_test_workers),
+    )
+    suppress_rule(worker_service, 'scaling-cpu-only', 'load generators are CPU bound')
+    master_service.connections.allow_from(worker_service, ec2.Port.tcp(LOCUST_MASTER_PORT))
+
+    core.CfnOutput(scope, 'loadTestMasterService', value=master_service.service_name)
+    return master_service, worker_service
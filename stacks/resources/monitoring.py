@@ -1,7 +1,38 @@
+import json
+import os
+from typing import Dict, List
+
 from aws_cdk import (
+    aws_cloudwatch as cloudwatch,
+    aws_ec2 as ec2,
+    aws_ecs as ecs,
+    aws_elasticache as elasticache,
+    aws_elasticloadbalancingv2 as elbv2,
+    aws_events as events,
+    aws_events_targets as events_targets,
+    aws_lambda as lambda_,
     aws_logs as logs,
+    aws_rds as rds,
     core,
 )
+from aws_cdk.aws_ec2 import IVpc
+
+from stacks.resources.storage import (
+    BROKER_REDIS_ROLE,
+    DEFAULT_REDIS_ROLE,
+    get_instance_memory_mib,
+    get_postgres_parameters,
+    get_redis_resource_id,
+)
+from stacks.settings import StackConfig
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'functions')
+
+QUEUE_METRIC_NAMESPACE = 'Celery'
+QUEUE_METRIC_NAME = 'QueueLength'
+
+DASHBOARD_WIDGET_WIDTH = 8
+ALARM_PERIOD = core.Duration.minutes(5)
 
 
 def create_log_group(scope: core.Construct, stack_name: str):
@@ -10,3 +41,322 @@ def create_log_group(scope: core.Construct, stack_name: str):
         retention=logs.RetentionDays.ONE_WEEK,
         log_group_name=stack_name,
     )
+
+
+def get_queue_length_metric(stack_name: str, pool: str = 'worker'):
+    return cloudwatch.Metric(
+        namespace=QUEUE_METRIC_NAMESPACE,
+        metric_name=QUEUE_METRIC_NAME,
+        dimensions={'StackName': stack_name, 'Pool': pool},
+        period=core.Duration.minutes(1),
+        statistic='Maximum',
+    )
+
+
+def create_queue_length_publisher(
+    scope: core.Construct,
+    stack_name: str,
+    vpc: IVpc,
+    redis_host: str,
+    redis_port: str,
+    queue_pools: dict,
+):
+    with open(os.path.join(FUNCTIONS_DIR, 'queue_length.py')) as source:
+        code = source.read()
+
+    # inline code, it doesn't need an assets bucket (CDK bootstrap)
+    function = lambda_.Function(
+        scope, 'queueLength',
+        function_name=f'{stack_name}-queue-length',
+        description=f'Publishes the Celery queue length of {stack_name}. Managed by AWS CDK.',
+        runtime=lambda_.Runtime('python3.12', lambda_.RuntimeFamily.PYTHON, supports_inline_code=True),
+        handler='index.handler',
+        code=lambda_.Code.from_inline(code),
+        timeout=core.Duration.seconds(30),
+        memory_size=128,
+        vpc=vpc,
+        vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE),
+        environment={
+            'STACK_NAME': stack_name,
+            'REDIS_HOST': redis_host,
+            'REDIS_PORT': redis_port,
+            'QUEUE_POOLS': json.dumps(queue_pools),
+            'METRIC_NAMESPACE': QUEUE_METRIC_NAMESPACE,
+            'METRIC_NAME': QUEUE_METRIC_NAME,
+        },
+    )
+    cloudwatch.Metric.grant_put_metric_data(function)
+
+    events.Rule(
+        scope, 'queueLengthSchedule',
+        schedule=events.Schedule.rate(core.Duration.minutes(1)),
+        targets=[events_targets.LambdaFunction(function)],
+    )
+    return function
+
+
+def get_cache_node_ids(cache: core.CfnResource) -> List[str]:
+    """CacheClusterId of every node, the dimension of the ElastiCache metrics."""
+    if isinstance(cache, elasticache.CfnCacheCluster):
+        return [cache.ref]
+    if cache.num_node_groups:
+        return [
+            f'{cache.ref}-{shard:04d}-{node:03d}'
+            for shard in range(1, cache.num_node_groups + 1)
+            for node in range(1, cache.replicas_per_node_group + 2)
+        ]
+    return [f'{cache.ref}-{node:03d}' for node in range(1, cache.num_cache_clusters + 1)]
+
+
+def get_cache_metric(cache: core.CfnResource, metric_name: str, statistic: str, label: str, expression: str = 'MAX'):
+    """One metric over every node of the cache, `MAX` or `SUM` of the nodes."""
+    # ids unique per metric, a graph can show several of them
+    metric_id = metric_name[0].lower() + metric_name[1:]
+    metrics = {
+        f'{metric_id}{index}': cloudwatch.Metric(
+            namespace='AWS/ElastiCache',
+            metric_name=metric_name,
+            dimensions={'CacheClusterId': node_id},
+            statistic=statistic,
+        )
+        for index, node_id in enumerate(get_cache_node_ids(cache))
+    }
+    if len(metrics) == 1:
+        return next(iter(metrics.values())).with_(label=label)
+    return cloudwatch.MathExpression(
+        expression=f'{expression}([{", ".join(metrics)}])',
+        using_metrics=metrics,
+        label=label,
+        period=core.Duration.minutes(5),
+    )
+
+
+def get_running_tasks_metric(service: ecs.FargateService):
+    # container insights, enabled in `create_cluster`
+    return cloudwatch.Metric(
+        namespace='ECS/ContainerInsights',
+        metric_name='RunningTaskCount',
+        dimensions={
+            'ClusterName': service.cluster.cluster_name,
+            'ServiceName': service.service_name,
+        },
+        statistic='Average',
+        label='running tasks',
+    )
+
+
+def create_dashboard(
+    scope: core.Construct,
+    stack_name: str,
+    load_balancer: elbv2.ApplicationLoadBalancer,
+    services: Dict[str, ecs.FargateService],
+    database: rds.DatabaseInstance,
+    caches: Dict[str, core.CfnResource],
+    queue_lengths: Dict[str, cloudwatch.IMetric] = None,
+):
+    dashboard = cloudwatch.Dashboard(scope, 'dashboard', dashboard_name=stack_name)
+
+    dashboard.add_widgets(
+        cloudwatch.GraphWidget(
+            title='Load balancer latency',
+            width=DASHBOARD_WIDGET_WIDTH,
+            left=[
+                load_balancer.metric_target_response_time(statistic=statistic, label=statistic)
+                for statistic in ('p50', 'p95', 'p99')
+            ],
+        ),
+        cloudwatch.GraphWidget(
+            title='Load balancer 5xx',
+            width=DASHBOARD_WIDGET_WIDTH,
+            left=[
+                load_balancer.metric_http_code_elb(elbv2.HttpCodeElb.ELB_5XX_COUNT, label='load balancer'),
+                load_balancer.metric_http_code_target(elbv2.HttpCodeTarget.TARGET_5XX_COUNT, label='targets'),
+            ],
+            right=[load_balancer.metric_request_count(label='requests')],
+        ),
+    )
+    dashboard.add_widgets(*[
+        cloudwatch.GraphWidget(
+            title=f'{role} service',
+            width=DASHBOARD_WIDGET_WIDTH,
+            left=[
+                service.metric_cpu_utilization(label='CPU %'),
+                service.metric_memory_utilization(label='memory %'),
+            ],
+            left_y_axis=cloudwatch.YAxisProps(min=0, max=100),
+            right=[get_running_tasks_metric(service)],
+        )
+        for role, service in services.items()
+    ])
+    dashboard.add_widgets(
+        cloudwatch.GraphWidget(
+            title='Database',
+            width=DASHBOARD_WIDGET_WIDTH,
+            left=[database.metric_cpu_utilization(label='CPU %')],
+            right=[
+                database.metric_database_connections(label='connections'),
+                # Aurora Serverless v2 capacity in ACUs
+                *([database.metric('ServerlessDatabaseCapacity', statistic='Maximum', label='ACUs')]
+                  if isinstance(database, rds.DatabaseCluster) else []),
+            ],
+        ),
+        cloudwatch.GraphWidget(
+            title='Database latency',
+            width=DASHBOARD_WIDGET_WIDTH,
+            left=[
+                database.metric('ReadLatency', statistic='Average', label='read'),
+                database.metric('WriteLatency', statistic='Average', label='write'),
+            ],
+        ),
+    )
+    for role, cache in caches.items():
+        title = 'Redis' if role == DEFAULT_REDIS_ROLE else f'Redis {role}'
+        dashboard.add_widgets(
+            cloudwatch.GraphWidget(
+                title=title,
+                width=DASHBOARD_WIDGET_WIDTH,
+                left=[get_cache_metric(cache, 'EngineCPUUtilization', 'Maximum', 'engine CPU %')],
+                right=[get_cache_metric(cache, 'Evictions', 'Sum', 'evictions', expression='SUM')],
+            ),
+            cloudwatch.GraphWidget(
+                title=f'{title} hit ratio',
+                width=DASHBOARD_WIDGET_WIDTH,
+                left=[get_cache_metric(cache, 'CacheHitRate', 'Average', 'hit %', expression='AVG')],
+                left_y_axis=cloudwatch.YAxisProps(min=0, max=100),
+            ),
+        )
+    if queue_lengths:
+        dashboard.add_widgets(
+            cloudwatch.GraphWidget(
+                title='Queue length',
+                width=DASHBOARD_WIDGET_WIDTH,
+                left=[metric.with_(label=pool) for pool, metric in queue_lengths.items()],
+            ),
+        )
+    return dashboard
+
+
+def create_alarm(
+    scope: core.Construct,
+    id: str,
+    stack_name: str,
+    config: StackConfig,
+    metric: cloudwatch.IMetric,
+    threshold: float,
+    description: str,
+    comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+):
+    alarm = cloudwatch.Alarm(
+        scope, id,
+        alarm_name=f'{stack_name}-{id}',
+        alarm_description=f'{stack_name}: {description}',
+        metric=metric,
+        threshold=threshold,
+        comparison_operator=comparison_operator,
+        period=ALARM_PERIOD,
+        evaluation_periods=3,
+        datapoints_to_alarm=2,
+        treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+    )
+    if config.alarm_topic_arn:
+        # plain SNS topic ARNs, no need of the cloudwatch actions module
+        cfn_alarm = alarm.node.default_child
+        cfn_alarm.alarm_actions = [config.alarm_topic_arn]
+        cfn_alarm.ok_actions = [config.alarm_topic_arn]
+    return alarm
+
+
+def create_alarms(
+    scope: core.Construct,
+    stack_name: str,
+    config: StackConfig,
+    load_balancer: elbv2.ApplicationLoadBalancer,
+    services: Dict[str, ecs.FargateService],
+    database: rds.DatabaseInstance,
+    caches: Dict[str, core.CfnResource],
+    queue_lengths: Dict[str, cloudwatch.IMetric] = None,
+):
+    """Alarms on the thresholds of the config, an empty threshold skips its alarm."""
+    alarms = []
+
+    def add_alarm(id: str, threshold, metric: cloudwatch.IMetric, description: str, **kwargs):
+        if threshold is not None:
+            alarms.append(create_alarm(scope, id, stack_name, config, metric, threshold, description, **kwargs))
+
+    add_alarm(
+        'latencyAlarm', config.alarm_latency_p99,
+        load_balancer.metric_target_response_time(statistic='p99'),
+        f'p99 latency above {config.alarm_latency_p99}s',
+    )
+    add_alarm(
+        'errorsAlarm', config.alarm_5xx_count,
+        cloudwatch.MathExpression(
+            expression='elb + target',
+            using_metrics={
+                'elb': load_balancer.metric_http_code_elb(elbv2.HttpCodeElb.ELB_5XX_COUNT),
+                'target': load_balancer.metric_http_code_target(elbv2.HttpCodeTarget.TARGET_5XX_COUNT),
+            },
+            period=ALARM_PERIOD,
+        ),
+        f'more than {config.alarm_5xx_count} 5xx responses in 5 minutes',
+    )
+    for role, service in services.items():
+        add_alarm(
+            f'{role}CpuAlarm', config.alarm_service_cpu,
+            service.metric_cpu_utilization(),
+            f'{role} service CPU above {config.alarm_service_cpu}%',
+        )
+        add_alarm(
+            f'{role}MemoryAlarm', config.alarm_service_memory,
+            service.metric_memory_utilization(),
+            f'{role} service memory above {config.alarm_service_memory}%',
+        )
+
+    add_alarm(
+        'databaseCpuAlarm', config.alarm_database_cpu,
+        database.metric_cpu_utilization(),
+        f'database CPU above {config.alarm_database_cpu}%',
+    )
+    # the max_connections of Aurora Serverless v2 follow its capacity
+    memory_mib = None if isinstance(database, rds.DatabaseCluster) else get_instance_memory_mib(config.database_size)
+    if memory_mib and config.alarm_database_connections is not None:
+        max_connections = int(get_postgres_parameters(memory_mib, config.database_max_connections)['max_connections'])
+        add_alarm(
+            'databaseConnectionsAlarm', max_connections * config.alarm_database_connections // 100,
+            database.metric_database_connections(statistic='Maximum'),
+            f'database connections above {config.alarm_database_connections}% of {max_connections}',
+        )
+    for operation in ('Read', 'Write'):
+        add_alarm(
+            f'database{operation}LatencyAlarm', config.alarm_database_latency,
+            database.metric(f'{operation}Latency', statistic='Average'),
+            f'database {operation.lower()} latency above {config.alarm_database_latency}s',
+        )
+
+    for role, cache in caches.items():
+        name = 'Redis' if role == DEFAULT_REDIS_ROLE else f'Redis {role}'
+        add_alarm(
+            get_redis_resource_id(role, 'cacheCpuAlarm'), config.alarm_cache_cpu,
+            get_cache_metric(cache, 'EngineCPUUtilization', 'Maximum', 'engine CPU %'),
+            f'{name} engine CPU above {config.alarm_cache_cpu}%',
+        )
+        add_alarm(
+            get_redis_resource_id(role, 'cacheEvictionsAlarm'), config.alarm_cache_evictions,
+            get_cache_metric(cache, 'Evictions', 'Sum', 'evictions', expression='SUM'),
+            f'more than {config.alarm_cache_evictions} {name} evictions in 5 minutes',
+        )
+        # queues are read once, a broker has no hit ratio
+        if role != BROKER_REDIS_ROLE:
+            add_alarm(
+                get_redis_resource_id(role, 'cacheHitRatioAlarm'), config.alarm_cache_hit_ratio,
+                get_cache_metric(cache, 'CacheHitRate', 'Average', 'hit %', expression='AVG'),
+                f'{name} hit ratio below {config.alarm_cache_hit_ratio}%',
+                comparison_operator=cloudwatch.ComparisonOperator.LESS_THAN_THRESHOLD,
+            )
+    for pool, metric in (queue_lengths or {}).items():
+        add_alarm(
+            f'{pool}QueueAlarm', config.alarm_queue_length,
+            metric,
+            f'{pool} queue longer than {config.alarm_queue_length} messages',
+        )
+    return alarms
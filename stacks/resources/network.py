@@ -1,24 +1,44 @@
 from aws_cdk import (
+    aws_certificatemanager as certificate_manager,
+    aws_cloudfront as cloudfront,
+    aws_cloudfront_origins as origins,
     aws_ec2 as ec2,
     aws_ecs as ecs,
     aws_route53 as route53,
     aws_route53_targets as route53_targets,
     aws_elasticloadbalancingv2 as elbv2,
+    aws_s3 as s3,
     core,
 )
 
 from stacks.settings import StackConfig
 
+VPC_AZS = 2
+VPC_GATEWAY_ENDPOINTS = {
+    's3': ec2.GatewayVpcEndpointAwsService.S3,
+}
+VPC_INTERFACE_ENDPOINTS = {
+    'ecr': {
+        'ecrApi': ec2.InterfaceVpcEndpointAwsService.ECR,
+        'ecrDocker': ec2.InterfaceVpcEndpointAwsService.ECR_DOCKER,
+    },
+    'logs': {'logs': ec2.InterfaceVpcEndpointAwsService.CLOUDWATCH_LOGS},
+    'ssm': {'ssm': ec2.InterfaceVpcEndpointAwsService.SSM},
+    'kms': {'kms': ec2.InterfaceVpcEndpointAwsService.KMS},
+    'secretsmanager': {'secretsManager': ec2.InterfaceVpcEndpointAwsService.SECRETS_MANAGER},
+}
+
 
 def retrieve_vpc(scope: core.Construct, vpc_name: str):
     return ec2.Vpc.from_lookup(scope, 'vpc', vpc_name=vpc_name)
 
 
-def create_vpc(scope: core.Construct, vpc_name: str):
-    return ec2.Vpc(
+def create_vpc(scope: core.Construct, vpc_name: str, config: StackConfig = None):
+    nat_per_az = config.vpc_nat_per_az if config else False
+    vpc = ec2.Vpc(
         scope,
         vpc_name,
-        max_azs=2,
+        max_azs=VPC_AZS,
         cidr='10.10.0.0/16',
         # configuration will create 3 groups in 2 AZs = 6 subnets.
         subnet_configuration=[
@@ -36,9 +56,38 @@ def create_vpc(scope: core.Construct, vpc_name: str):
                 cidr_mask=24  # 256 ip addresses
             )
         ],
-        nat_gateways=1,
+        nat_gateways=VPC_AZS if nat_per_az else 1,
     )
 
+    for endpoint in (config.vpc_endpoints if config else None) or []:
+        add_vpc_endpoint(vpc, endpoint)
+
+    return vpc
+
+
+def add_vpc_endpoint(vpc: ec2.Vpc, endpoint: str):
+    # keeps image pulls, logs and parameters off the NAT gateways
+    if endpoint in VPC_GATEWAY_ENDPOINTS:
+        vpc.add_gateway_endpoint(
+            f'{endpoint}Endpoint',
+            service=VPC_GATEWAY_ENDPOINTS[endpoint],
+            subnets=[
+                ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE),
+                ec2.SubnetSelection(subnet_type=ec2.SubnetType.ISOLATED),
+            ],
+        )
+    elif endpoint in VPC_INTERFACE_ENDPOINTS:
+        for name, service in VPC_INTERFACE_ENDPOINTS[endpoint].items():
+            vpc.add_interface_endpoint(
+                f'{name}Endpoint',
+                service=service,
+                private_dns_enabled=True,
+                subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE),
+            )
+    else:
+        choices = [*VPC_GATEWAY_ENDPOINTS, *VPC_INTERFACE_ENDPOINTS]
+        raise ValueError(f'Invalid VPC endpoint {endpoint}, choices: {choices}')
+
 
 def create_load_balancer(scope: core.Construct, vpc: ec2.IVpc):
     return elbv2.ApplicationLoadBalancer(
@@ -70,7 +119,7 @@ def configure_load_balancing(
             certificates=[ssl_certificate],
             open=True
         )
-        https_listener.add_targets(
+        return https_listener.add_targets(
             'target', port=80,
             deregistration_delay=core.Duration.seconds(30),
             slow_start=core.Duration.seconds(30),
@@ -79,7 +128,7 @@ def configure_load_balancing(
         )
     else:
         http_listener = load_balancer.add_listener('listener', port=80, open=True)
-        http_listener.add_targets(
+        return http_listener.add_targets(
             'target', port=80,
             deregistration_delay=core.Duration.seconds(30),
             slow_start=core.Duration.seconds(30),
@@ -88,10 +137,94 @@ def configure_load_balancing(
         )
 
 
+def get_origin_domain_name(config: StackConfig):
+    # the load balancer certificate has to cover this name too
+    return f'{config.dns_stack_subdomain}-origin.{config.dns_name}'
+
+
+def create_distribution(
+    scope: core.Construct,
+    stack_name: str,
+    config: StackConfig,
+    s3_bucket: s3.Bucket,
+):
+    # CloudFront only takes certificates from us-east-1
+    if config.cdn_certificate_arn:
+        certificate = certificate_manager.Certificate.from_certificate_arn(
+            scope, 'cdnCertificate', config.cdn_certificate_arn
+        )
+    elif scope.region == 'us-east-1':
+        certificate = certificate_manager.Certificate.from_certificate_arn(
+            scope, 'cdnCertificate',
+            scope.format_arn(service='acm', resource='certificate', resource_name=config.certificate_key_id),
+        )
+    else:
+        raise ValueError(f'CloudFront of {stack_name} needs a us-east-1 certificate in cdn_certificate_arn')
+
+    if config.cdn_app_max_ttl <= 0:
+        raise ValueError(f'cdn_app_max_ttl of {stack_name} must be positive, the app sends Cache-Control to cache')
+
+    static_behavior = cloudfront.BehaviorOptions(
+        origin=origins.S3Origin(s3_bucket),
+        viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+        compress=True,
+        cache_policy=cloudfront.CachePolicy(
+            scope, 'staticCachePolicy',
+            cache_policy_name=f'{stack_name}-static',
+            default_ttl=core.Duration.seconds(config.cdn_static_ttl),
+            max_ttl=core.Duration.seconds(config.cdn_static_ttl),
+            min_ttl=core.Duration.seconds(0),
+            enable_accept_encoding_gzip=True,
+        ),
+    )
+    # nothing is cached unless the app sends Cache-Control
+    app_behavior = cloudfront.BehaviorOptions(
+        origin=origins.HttpOrigin(
+            get_origin_domain_name(config),
+            protocol_policy=cloudfront.OriginProtocolPolicy.HTTPS_ONLY,
+        ),
+        viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+        allowed_methods=cloudfront.AllowedMethods.ALLOW_ALL,
+        compress=True,
+        cache_policy=cloudfront.CachePolicy(
+            scope, 'appCachePolicy',
+            cache_policy_name=f'{stack_name}-app',
+            default_ttl=core.Duration.seconds(0),
+            max_ttl=core.Duration.seconds(config.cdn_app_max_ttl),
+            min_ttl=core.Duration.seconds(0),
+            header_behavior=cloudfront.CacheHeaderBehavior.allow_list('Authorization'),
+            cookie_behavior=cloudfront.CacheCookieBehavior.all(),
+            query_string_behavior=cloudfront.CacheQueryStringBehavior.all(),
+            enable_accept_encoding_gzip=True,
+        ),
+        origin_request_policy=cloudfront.OriginRequestPolicy(
+            scope, 'appOriginRequestPolicy',
+            origin_request_policy_name=f'{stack_name}-app',
+            header_behavior=cloudfront.OriginRequestHeaderBehavior.all(),
+            cookie_behavior=cloudfront.OriginRequestCookieBehavior.all(),
+            query_string_behavior=cloudfront.OriginRequestQueryStringBehavior.all(),
+        ),
+    )
+
+    return cloudfront.Distribution(
+        scope, 'distribution',
+        comment=f'{stack_name}. Managed by AWS CDK.',
+        domain_names=[f'{config.dns_stack_subdomain}.{config.dns_name}'],
+        certificate=certificate,
+        default_behavior=app_behavior,
+        additional_behaviors={
+            '/static/*': static_behavior,
+            '/media/*': static_behavior,
+        },
+        price_class=cloudfront.PriceClass.PRICE_CLASS_ALL,
+    )
+
+
 def configure_domain(
     scope: core.Construct,
     load_balancer: elbv2.ApplicationLoadBalancer,
     config: StackConfig,
+    distribution: cloudfront.Distribution = None,
 ):
     # // DNS record
     zone = route53.HostedZone.from_hosted_zone_attributes(
@@ -100,5 +233,13 @@ def configure_domain(
         hosted_zone_id=config.dns_zone_id,
     )
     target = route53.RecordTarget.from_alias(route53_targets.LoadBalancerTarget(load_balancer))
+    if distribution:
+        # the load balancer stays reachable for CloudFront under the origin name
+        route53.ARecord(
+            scope, 'origin-domain',
+            zone=zone,
+            record_name=get_origin_domain_name(config),
+            target=target,
+        )
+        target = route53.RecordTarget.from_alias(route53_targets.CloudFrontTarget(distribution))
     route53.ARecord(scope, 'stack-domain', zone=zone, record_name=config.dns_stack_subdomain, target=target)
-
@@ -1,4 +1,7 @@
 
+import re
+from typing import Dict, Optional
+
 from aws_cdk import (
     aws_ec2 as ec2,
     aws_ecs as ecs,
@@ -13,6 +16,45 @@ from aws_cdk.core import RemovalPolicy
 
 from stacks.settings import StackConfig
 
+POSTGRES_PORT = 5432
+REDIS_PORT = 6379
+REDIS_ENGINE_VERSION = '6.x'
+REDIS_CLUSTER_PARAMETER_GROUP = 'default.redis6.x.cluster.on'
+REDIS_PARAMETER_GROUP_FAMILY = 'redis6.x'
+REDIS_MAXMEMORY_POLICIES = (
+    'volatile-lru', 'allkeys-lru', 'volatile-lfu', 'allkeys-lfu',
+    'volatile-random', 'allkeys-random', 'volatile-ttl', 'noeviction',
+)
+# a full cache drops its least recently used keys, a full broker rejects the writes and never loses a task
+REDIS_ROLE_POLICIES = {'cache': 'allkeys-lru', 'broker': 'noeviction'}
+REDIS_ROLE_OPTIONS = ('node_type', 'num_cache_nodes', 'maxmemory_policy')
+# single Redis of the stacks without `cache_roles`
+DEFAULT_REDIS_ROLE = 'default'
+BROKER_REDIS_ROLE = 'broker'
+# image tag of the BuildKit layer cache in the stack repository
+BUILD_CACHE_TAG = 'buildcache'
+
+# Memory (GiB) of the `large` size of each instance family
+INSTANCE_FAMILY_MEMORY_GIB = {
+    'm4': 8, 'm5': 8, 'm5d': 8, 'm6g': 8, 'm6gd': 8, 'm6i': 8, 'm7g': 8,
+    'r4': 15.25, 'r5': 16, 'r5b': 16, 'r5d': 16, 'r6g': 16, 'r6gd': 16, 'r6i': 16, 'r7g': 16,
+    'x2g': 32,
+}
+INSTANCE_SIZE_FACTOR = {
+    'large': 1, 'xlarge': 2, '2xlarge': 4, '4xlarge': 8, '8xlarge': 16,
+    '12xlarge': 24, '16xlarge': 32, '24xlarge': 48,
+}
+BURSTABLE_MEMORY_GIB = {'micro': 1, 'small': 2, 'medium': 4, 'large': 8, 'xlarge': 16, '2xlarge': 32}
+BURSTABLE_FAMILIES = ('t2', 't3', 't4g')
+
+# gp3 below this size runs the baseline 3000 IOPS / 125 MiBps and cannot be provisioned
+GP3_PROVISIONED_MIN_STORAGE = 400
+
+DATABASE_ENGINES = ('postgres', 'aurora-postgresql')
+AURORA_SERVERLESS_INSTANCE_CLASS = 'serverless'
+
+LOGS_BUCKET_EXPIRATION_DAYS = 90
+
 
 def create_bucket(scope: core.Construct, stack_name: str):
     return s3.Bucket(
@@ -23,7 +65,53 @@ def create_bucket(scope: core.Construct, stack_name: str):
     )
 
 
-def create_redis_cache(scope: core.Construct, stack_name: str, vpc: IVpc, config: StackConfig):
+def create_logs_bucket(scope: core.Construct, stack_name: str):
+    # private, unlike the statics bucket
+    return s3.Bucket(
+        scope, 'logsBucket',
+        bucket_name=f'{stack_name}-logs',
+        block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+        encryption=s3.BucketEncryption.S3_MANAGED,
+        lifecycle_rules=[s3.LifecycleRule(expiration=core.Duration.days(LOGS_BUCKET_EXPIRATION_DAYS))],
+        removal_policy=RemovalPolicy.RETAIN,
+    )
+
+
+def get_redis_roles(config: StackConfig) -> Dict[str, dict]:
+    """Options of every Redis of the stack, by role."""
+    if not config.cache_roles:
+        return {DEFAULT_REDIS_ROLE: dict(node_type=config.cache_node_type, num_cache_nodes=config.num_cache_nodes)}
+
+    roles = dict()
+    for role, options in config.cache_roles.items():
+        options = options or {}
+        if not re.match(r'^[a-z][a-z0-9]*$', role) or role == DEFAULT_REDIS_ROLE:
+            raise ValueError(f'Invalid Redis role {role} of {config.stack_name}, lowercase letters and digits only')
+        unknown_options = set(options) - set(REDIS_ROLE_OPTIONS)
+        if unknown_options:
+            raise ValueError(f'Unknown options {", ".join(sorted(unknown_options))} of Redis role {role}')
+        maxmemory_policy = options.get('maxmemory_policy') or REDIS_ROLE_POLICIES.get(role)
+        if maxmemory_policy not in REDIS_MAXMEMORY_POLICIES:
+            raise ValueError(
+                f'Redis role {role} needs a maxmemory_policy, choices: {", ".join(REDIS_MAXMEMORY_POLICIES)}'
+            )
+        roles[role] = dict(
+            node_type=options.get('node_type') or config.cache_node_type,
+            num_cache_nodes=options.get('num_cache_nodes') or config.num_cache_nodes,
+            maxmemory_policy=maxmemory_policy,
+        )
+    return roles
+
+
+def get_redis_resource_id(role: str, resource_id: str) -> str:
+    # the single Redis keeps the ids that predate the roles
+    if role == DEFAULT_REDIS_ROLE:
+        return resource_id
+    return f'{role}{resource_id[0].upper()}{resource_id[1:]}'
+
+
+def create_redis_caches(scope: core.Construct, stack_name: str, vpc: IVpc, config: StackConfig):
+    """One Redis per role of `cache_roles`, or a single Redis for every use. Returns them by role."""
     subnet_ids = vpc.select_subnets(subnet_type=ec2.SubnetType.PRIVATE).subnet_ids
 
     cache_subnet_group = elasticache.CfnSubnetGroup(
@@ -39,83 +127,289 @@ def create_redis_cache(scope: core.Construct, stack_name: str, vpc: IVpc, config
         security_group_name=f'{stack_name}-redis',
         description=stack_name,
     )
-    cache = elasticache.CfnCacheCluster(
-        scope, 'elasticache',
-        cluster_name=stack_name,
-        engine='redis', port=6379,
-        cache_node_type=config.cache_node_type,
-        num_cache_nodes=config.num_cache_nodes,
-        cache_subnet_group_name=cache_subnet_group.cache_subnet_group_name,
-        vpc_security_group_ids=[cache_security_group.security_group_id],
+    cache_security_group.add_ingress_rule(
+        ec2.Peer.any_ipv4(), ec2.Port.tcp(REDIS_PORT), 'Allow Cache Access'
     )
 
-    cache_security_group.add_ingress_rule(
-        ec2.Peer.any_ipv4(), ec2.Port.tcp(6379), 'Allow Cache Access'
+    caches = dict()
+    for role, options in get_redis_roles(config).items():
+        caches[role] = create_redis_cache(
+            scope=scope,
+            stack_name=stack_name,
+            config=config,
+            role=role,
+            cache_subnet_group=cache_subnet_group,
+            cache_security_group=cache_security_group,
+            **options,
+        )
+    return caches
+
+
+def create_redis_parameter_group(
+    scope: core.Construct,
+    stack_name: str,
+    config: StackConfig,
+    role: str,
+    maxmemory_policy: str,
+):
+    properties = {'maxmemory-policy': maxmemory_policy}
+    if config.cache_replication and config.cache_cluster_mode:
+        properties['cluster-enabled'] = 'yes'
+    return elasticache.CfnParameterGroup(
+        scope, get_redis_resource_id(role, 'cacheParameterGroup'),
+        cache_parameter_group_family=REDIS_PARAMETER_GROUP_FAMILY,
+        description=f'{stack_name} {role}',
+        properties=properties,
     )
 
+
+def create_redis_cache(
+    scope: core.Construct,
+    stack_name: str,
+    config: StackConfig,
+    role: str,
+    cache_subnet_group: elasticache.CfnSubnetGroup,
+    cache_security_group: ec2.SecurityGroup,
+    node_type: str,
+    num_cache_nodes: int,
+    maxmemory_policy: str = None,
+):
+    cache_name = stack_name if role == DEFAULT_REDIS_ROLE else f'{stack_name}-{role}'
+    cache_props = dict()
+    if maxmemory_policy:
+        parameter_group = create_redis_parameter_group(scope, stack_name, config, role, maxmemory_policy)
+        cache_props['engine_version'] = REDIS_ENGINE_VERSION
+        cache_props['cache_parameter_group_name'] = parameter_group.ref
+
+    if config.cache_replication:
+        cache = create_redis_replication_group(
+            scope=scope,
+            stack_name=cache_name,
+            config=config,
+            cache_subnet_group=cache_subnet_group,
+            cache_security_group=cache_security_group,
+            id=get_redis_resource_id(role, 'replicationGroup'),
+            node_type=node_type,
+            **cache_props,
+        )
+    else:
+        cache = elasticache.CfnCacheCluster(
+            scope, get_redis_resource_id(role, 'elasticache'),
+            cluster_name=cache_name,
+            engine='redis', port=REDIS_PORT,
+            cache_node_type=node_type,
+            num_cache_nodes=num_cache_nodes,
+            cache_subnet_group_name=cache_subnet_group.cache_subnet_group_name,
+            vpc_security_group_ids=[cache_security_group.security_group_id],
+            **cache_props,
+        )
+    cache.add_depends_on(cache_subnet_group)
+
     core.CfnOutput(
         scope=scope,
-        id='redisAddress',
-        value=cache.attr_redis_endpoint_address
+        id=get_redis_resource_id(role, 'redisAddress'),
+        value=get_cache_endpoints(cache)[0]
     )
 
     return cache
 
 
-def create_rds_cluster(
+def create_redis_replication_group(
     scope: core.Construct,
-    stack_name: str, vpc: IVpc,
-    database_name: str,
-    database_username: str,
-    datbase_password: str,
-    database_encrypted: bool
+    stack_name: str,
+    config: StackConfig,
+    cache_subnet_group: elasticache.CfnSubnetGroup,
+    cache_security_group: ec2.SecurityGroup,
+    id: str = 'replicationGroup',
+    node_type: str = None,
+    **cache_props,
 ):
-    subnet_ids = []
-    for subnet in vpc.private_subnets:
-        subnet_ids.append(subnet.subnet_id)
+    has_replicas = config.cache_replicas_per_shard > 0
+    if config.cache_multi_az and not has_replicas:
+        raise ValueError(f'Redis Multi-AZ of {stack_name} needs at least one replica per shard')
 
-    db_subnet_group = rds.CfnDBSubnetGroup(
-        scope=scope,
-        id='dbSubnetGroup',
-        db_subnet_group_description='Subnet group to access RDS',
-        db_subnet_group_name=stack_name,
-        subnet_ids=subnet_ids,
+    group_props = dict(cache_props, engine_version=REDIS_ENGINE_VERSION)
+    if config.cache_cluster_mode:
+        group_props['num_node_groups'] = config.cache_shards
+        group_props['replicas_per_node_group'] = config.cache_replicas_per_shard
+        group_props.setdefault('cache_parameter_group_name', REDIS_CLUSTER_PARAMETER_GROUP)
+    else:
+        group_props['num_cache_clusters'] = 1 + config.cache_replicas_per_shard
+
+    return elasticache.CfnReplicationGroup(
+        scope, id,
+        replication_group_id=stack_name,
+        replication_group_description=stack_name,
+        engine='redis',
+        port=REDIS_PORT,
+        cache_node_type=node_type or config.cache_node_type,
+        cache_subnet_group_name=cache_subnet_group.cache_subnet_group_name,
+        security_group_ids=[cache_security_group.security_group_id],
+        # cluster mode always fails over to a replica
+        automatic_failover_enabled=config.cache_cluster_mode or has_replicas,
+        multi_az_enabled=config.cache_multi_az,
+        **group_props,
     )
 
-    db_scurity_group = ec2.SecurityGroup(
-        scope=scope,
-        id='dbSecurityGroup',
-        vpc=vpc,
-        allow_all_outbound=True,
-        description=stack_name,
+
+def get_cache_endpoints(cache: core.CfnResource):
+    """Returns the (primary, reader, port) endpoints of a cache cluster or replication group."""
+    if isinstance(cache, elasticache.CfnCacheCluster):
+        return cache.attr_redis_endpoint_address, cache.attr_redis_endpoint_address, cache.attr_redis_endpoint_port
+    if cache.num_node_groups:
+        # cluster mode, the client discovers the shards from the configuration endpoint
+        return (
+            cache.attr_configuration_end_point_address,
+            cache.attr_configuration_end_point_address,
+            cache.attr_configuration_end_point_port,
+        )
+    return cache.attr_primary_end_point_address, cache.attr_reader_end_point_address, cache.attr_primary_end_point_port
+
+
+def get_cache_environment(caches: Dict[str, core.CfnResource]):
+    """`REDIS_*` of the single Redis, `REDIS_<ROLE>_*` of every role."""
+    environment = dict()
+    for role, cache in caches.items():
+        prefix = 'REDIS' if role == DEFAULT_REDIS_ROLE else f'REDIS_{role.upper()}'
+        host, reader_host, port = get_cache_endpoints(cache)
+        environment.update({
+            f'{prefix}_HOST': host,
+            f'{prefix}_READER_HOST': reader_host,
+            f'{prefix}_PORT': port,
+            f'{prefix}_CLUSTER_MODE': 'true' if getattr(cache, 'num_node_groups', None) else 'false',
+        })
+    return environment
+
+
+def get_broker_cache(caches: Dict[str, core.CfnResource]) -> core.CfnResource:
+    if DEFAULT_REDIS_ROLE in caches:
+        return caches[DEFAULT_REDIS_ROLE]
+    if BROKER_REDIS_ROLE not in caches:
+        raise ValueError(f'The Celery queues need a `{BROKER_REDIS_ROLE}` Redis role in cache_roles')
+    return caches[BROKER_REDIS_ROLE]
+
+
+def create_rds_cluster(scope: core.Construct, stack_name: str, vpc: IVpc, config: StackConfig):
+    """Aurora PostgreSQL with Serverless v2 instances, it scales in place and never pauses."""
+    if not 0.5 <= config.database_min_capacity <= config.database_max_capacity <= 128:
+        raise ValueError(f'Serverless v2 capacity of {stack_name} must be between 0.5 and 128 ACUs, min <= max')
+    if config.database_tuned_parameters:
+        # Serverless v2 capacity changes, memory settings sized to an instance class don't fit
+        raise ValueError(f'database_tuned_parameters of {stack_name} is only supported by the postgres engine')
+
+    engine_version = config.database_aurora_version
+    database = rds.DatabaseCluster(
+        scope, f'{stack_name}-aurora',
+        engine=rds.DatabaseClusterEngine.aurora_postgres(
+            version=rds.AuroraPostgresEngineVersion.of(engine_version, engine_version.split('.')[0]),
+        ),
+        cluster_identifier=stack_name,
+        instance_identifier_base=f'{stack_name}-',
+        # the writer and `database_read_replicas` readers
+        instances=1 + config.database_read_replicas,
+        instance_props=rds.InstanceProps(
+            vpc=vpc,
+            vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE),
+            instance_type=ec2.InstanceType(AURORA_SERVERLESS_INSTANCE_CLASS),
+            allow_major_version_upgrade=False,
+            auto_minor_version_upgrade=False,
+            delete_automated_backups=True,
+            enable_performance_insights=True,
+        ),
+        credentials=rds.Credentials.from_username(config.database_username),
+        default_database_name=config.database_name,
+        port=POSTGRES_PORT,
+        backup=rds.BackupProps(retention=core.Duration.days(5)),
+        deletion_protection=False,
+        storage_encrypted=config.database_encrypted,
     )
-    db_scurity_group.add_ingress_rule(ec2.Peer.any_ipv4(), ec2.Port.tcp(5432))
+    # CDK 1.68 predates Serverless v2
+    database.node.default_child.add_property_override('ServerlessV2ScalingConfiguration', {
+        'MinCapacity': config.database_min_capacity,
+        'MaxCapacity': config.database_max_capacity,
+    })
 
-    database = rds.CfnDBCluster(
+    core.CfnOutput(
         scope=scope,
-        id='database',
-        database_name=database_name,
-        db_cluster_identifier=stack_name,
-        engine=rds.DatabaseInstanceEngine.POSTGRES,
-        engine_mode='serverless',
-        master_username=database_username,
-        master_user_password=core.SecretValue.plain_text(datbase_password).to_string(),
-        port=5432,
-        db_subnet_group_name=db_subnet_group.db_subnet_group_name,
-        vpc_security_group_ids=[db_scurity_group.security_group_id],
-        storage_encrypted=database_encrypted,
-        scaling_configuration=rds.CfnDBCluster.ScalingConfigurationProperty(
-            auto_pause=True,
-            max_capacity=2,
-            min_capacity=1,
-            seconds_until_auto_pause=3600,
-        )
+        id='rdsAddress',
+        value=database.cluster_endpoint.hostname
     )
-    database.add_depends_on(db_subnet_group)
 
     return database
 
 
+def get_instance_memory_mib(instance_class: str) -> Optional[int]:
+    """Memory of an instance class (`m5.large`), None when it isn't known."""
+    family, _, size = instance_class.replace('db.', '').partition('.')
+    if family in BURSTABLE_FAMILIES:
+        memory_gib = BURSTABLE_MEMORY_GIB.get(size)
+    elif family in INSTANCE_FAMILY_MEMORY_GIB and size in INSTANCE_SIZE_FACTOR:
+        memory_gib = INSTANCE_FAMILY_MEMORY_GIB[family] * INSTANCE_SIZE_FACTOR[size]
+    else:
+        memory_gib = None
+    return int(memory_gib * 1024) if memory_gib else None
+
+
+def get_postgres_parameters(memory_mib: int, max_connections: int = None):
+    """Memory settings sized to the instance, in the units RDS expects."""
+    memory_kib = memory_mib * 1024
+    if not max_connections:
+        # same as the RDS default: LEAST({DBInstanceClassMemory/9531392}, 5000)
+        max_connections = min(memory_mib * 1024 * 1024 // 9531392, 5000)
+
+    shared_buffers_kib = memory_kib // 4
+    work_mem_kib = (memory_kib - shared_buffers_kib) // (max_connections * 3)
+    return {
+        'max_connections': str(max_connections),
+        'shared_buffers': str(shared_buffers_kib // 8),  # 8kB pages
+        'effective_cache_size': str(memory_kib * 3 // 4 // 8),  # 8kB pages
+        'work_mem': str(max(work_mem_kib, 4096)),  # kB
+        'maintenance_work_mem': str(min(memory_kib // 16, 2 * 1024 * 1024)),  # kB
+    }
+
+
+def create_rds_parameter_group(scope: core.Construct, stack_name: str, config: StackConfig, engine: rds.IEngine):
+    # opt-in, switching the parameter group of a running instance only applies after a reboot
+    if not config.database_tuned_parameters:
+        return None
+    memory_mib = get_instance_memory_mib(config.database_size)
+    if not memory_mib:
+        raise ValueError(
+            f'database_tuned_parameters of {stack_name} needs a known instance class, {config.database_size} is not'
+        )
+
+    return rds.ParameterGroup(
+        scope, 'rdsParameterGroup',
+        engine=engine,
+        description=f'{stack_name} sized for {config.database_size}. Managed by AWS CDK.',
+        parameters=get_postgres_parameters(memory_mib, config.database_max_connections),
+    )
+
+
+def get_rds_storage_props(stack_name: str, config: StackConfig):
+    storage_type = config.database_storage_type
+    storage_props = dict()
+    if config.database_max_allocated_storage:
+        if config.database_max_allocated_storage <= config.database_allocated_storage:
+            raise ValueError(f'database_max_allocated_storage of {stack_name} must exceed the allocated storage')
+        storage_props['max_allocated_storage'] = config.database_max_allocated_storage
+
+    if storage_type == 'io1':
+        if not config.database_iops:
+            raise ValueError(f'io1 storage of {stack_name} needs database_iops')
+        storage_props['storage_type'] = rds.StorageType.IO1
+        storage_props['iops'] = config.database_iops
+    elif storage_type == 'gp3':
+        is_provisioned = config.database_iops or config.database_storage_throughput
+        if is_provisioned and config.database_allocated_storage < GP3_PROVISIONED_MIN_STORAGE:
+            raise ValueError(
+                f'gp3 IOPS/throughput of {stack_name} need at least {GP3_PROVISIONED_MIN_STORAGE} GiB of storage'
+            )
+    elif storage_type != 'gp2':
+        raise ValueError(f'Invalid database_storage_type {storage_type}, choices: gp2, gp3, io1')
+    return storage_props
+
+
 def create_rds_instance(
     scope: core.Construct,
     stack_name: str,
@@ -123,13 +417,15 @@ def create_rds_instance(
     config: StackConfig,
     ecs_cluster: ecs.Cluster,
 ):
+    engine = rds.DatabaseInstanceEngine.postgres(
+        version=rds.PostgresEngineVersion.VER_11
+    )
     database = rds.DatabaseInstance(
         scope, f'{stack_name}-rds',
         vpc=vpc,
-        engine=rds.DatabaseInstanceEngine.postgres(
-            version=rds.PostgresEngineVersion.VER_11
-        ),
-        port=5432,
+        engine=engine,
+        parameter_group=create_rds_parameter_group(scope, stack_name, config, engine),
+        port=POSTGRES_PORT,
         credentials=rds.Credentials.from_username(config.database_username),
         instance_identifier=stack_name,
         instance_type=ec2.InstanceType(config.database_size),
@@ -145,8 +441,18 @@ def create_rds_instance(
         storage_encrypted=config.database_encrypted,
 
         vpc_placement=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
+        **get_rds_storage_props(stack_name, config),
     )
 
+    if config.database_storage_type == 'gp3':
+        # CDK 1.68 only knows gp2/io1/standard
+        cfn_database = database.node.default_child
+        cfn_database.add_property_override('StorageType', 'gp3')
+        if config.database_iops:
+            cfn_database.add_property_override('Iops', config.database_iops)
+        if config.database_storage_throughput:
+            cfn_database.add_property_override('StorageThroughput', config.database_storage_throughput)
+
     core.CfnOutput(
         scope=scope,
         id='rdsAddress',
@@ -156,10 +462,136 @@ def create_rds_instance(
     return database
 
 
+def create_database(scope: core.Construct, stack_name: str, vpc: IVpc, config: StackConfig, ecs_cluster: ecs.Cluster):
+    if config.database_engine not in DATABASE_ENGINES:
+        raise ValueError(f'Invalid database_engine {config.database_engine}, choices: {", ".join(DATABASE_ENGINES)}')
+    if config.database_engine == 'aurora-postgresql':
+        return create_rds_cluster(scope, stack_name, vpc, config)
+    return create_rds_instance(scope, stack_name, vpc, config, ecs_cluster)
+
+
+def create_rds_proxy(scope: core.Construct, stack_name: str, vpc: IVpc, database: rds.DatabaseInstance):
+    # pools the connections of every task, they stay flat while the services scale out
+    proxy = database.add_proxy(
+        'proxy',
+        db_proxy_name=stack_name,
+        secrets=[database.secret],
+        vpc=vpc,
+        vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE),
+        require_tls=False,
+    )
+    database.connections.allow_default_port_from(proxy)
+
+    core.CfnOutput(
+        scope=scope,
+        id='rdsProxyAddress',
+        value=proxy.endpoint
+    )
+
+    return proxy
+
+
+def create_rds_proxy_reader_endpoint(
+    scope: core.Construct,
+    stack_name: str,
+    vpc: IVpc,
+    config: StackConfig,
+    database: rds.DatabaseInstance,
+    proxy: rds.DatabaseProxy,
+):
+    # routes to the Aurora readers, RDS Proxy has no read-only endpoint for instance read replicas,
+    # and unlike the cluster reader endpoint it doesn't fall back to the writer
+    if not isinstance(database, rds.DatabaseCluster) or not config.database_read_replicas:
+        return None
+
+    properties = {
+        'DBProxyEndpointName': f'{stack_name}-reader',
+        'DBProxyName': proxy.db_proxy_name,
+        'TargetRole': 'READ_ONLY',
+        'VpcSubnetIds': vpc.select_subnets(subnet_type=ec2.SubnetType.PRIVATE).subnet_ids,
+    }
+    # same security groups as the proxy, the VPC default one when it has none
+    security_groups = [group.security_group_id for group in proxy.connections.security_groups]
+    if security_groups:
+        properties['VpcSecurityGroupIds'] = security_groups
+
+    # AWS::RDS::DBProxyEndpoint has no construct in this CDK version
+    endpoint = core.CfnResource(scope, 'proxyReaderEndpoint', type='AWS::RDS::DBProxyEndpoint', properties=properties)
+
+    core.CfnOutput(
+        scope=scope,
+        id='rdsProxyReaderAddress',
+        value=endpoint.get_att('Endpoint').to_string()
+    )
+
+    return endpoint
+
+
+def create_rds_read_replicas(
+    scope: core.Construct,
+    stack_name: str,
+    vpc: IVpc,
+    config: StackConfig,
+    database: rds.DatabaseInstance,
+):
+    # the readers of a cluster are instances of the cluster
+    if isinstance(database, rds.DatabaseCluster):
+        return []
+
+    replicas = []
+    for index in range(1, config.database_read_replicas + 1):
+        replicas.append(
+            rds.DatabaseInstanceReadReplica(
+                scope, f'{stack_name}-rds-replica-{index}',
+                source_database_instance=database,
+                instance_identifier=f'{stack_name}-replica-{index}',
+                instance_type=ec2.InstanceType(config.database_replica_size or config.database_size),
+                vpc=vpc,
+                vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE),
+                storage_encrypted=config.database_encrypted,
+                port=POSTGRES_PORT,
+                delete_automated_backups=True,
+                deletion_protection=False,
+                auto_minor_version_upgrade=False,
+                enable_performance_insights=True,
+            )
+        )
+    return replicas
+
+
+def get_database_environment(
+    database: rds.DatabaseInstance,
+    proxy: rds.DatabaseProxy = None,
+    replicas: list = None,
+    proxy_reader_endpoint: core.CfnResource = None,
+):
+    if isinstance(database, rds.DatabaseCluster):
+        writer_host = proxy.endpoint if proxy else database.cluster_endpoint.hostname
+        if proxy_reader_endpoint:
+            reader_hosts = [proxy_reader_endpoint.get_att('Endpoint').to_string()]
+        else:
+            reader_hosts = [database.cluster_read_endpoint.hostname]
+    else:
+        writer_host = proxy.endpoint if proxy else database.db_instance_endpoint_address
+        reader_hosts = [replica.db_instance_endpoint_address for replica in replicas or []] or [writer_host]
+    return {
+        'DATABASE_HOST': writer_host,
+        'DATABASE_READER_HOSTS': core.Fn.join(',', reader_hosts),
+        'DATABASE_PORT': str(POSTGRES_PORT),
+    }
+
+
 def create_ecr_repository(scope: core.Construct, stack_name: str):
     return ecr.Repository(
         scope, 'ecr',
         lifecycle_rules=[
+            # the BuildKit cache of `build_cache_mode` registry, a lower priority rule can't expire it
+            ecr.LifecycleRule(
+                rule_priority=1,
+                tag_status=ecr.TagStatus.TAGGED,
+                tag_prefix_list=[BUILD_CACHE_TAG],
+                max_image_count=1,
+            ),
             ecr.LifecycleRule(max_image_age=core.Duration.days(30))
         ],
         removal_policy=core.RemovalPolicy.DESTROY,
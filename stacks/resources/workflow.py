@@ -1,15 +1,234 @@
+from typing import Dict
+
 from aws_cdk import (
     core,
+    aws_cloudwatch as cloudwatch,
+    aws_ec2 as ec2,
     aws_ecs as ecs,
     aws_ecr as ecr,
+    aws_iam as iam,
     aws_s3 as s3,
     aws_codebuild as codebuild,
     aws_codepipeline as codepipeline,
     aws_codepipeline_actions as actions,
 )
 
+from stacks.resources.storage import BUILD_CACHE_TAG
 from stacks.settings import StackConfig
 
+BUILDX_VERSION = 'v0.12.1'
+BUILDX_RELEASES_URL = 'https://github.com/docker/buildx/releases/download'
+SOCI_VERSION = '0.4.1'
+CONTAINERD_ADDRESS = '/var/run/docker/containerd/containerd.sock'
+BUILD_METRIC_NAMESPACE = 'CodeBuild/Images'
+BUILD_METRIC_NAME = 'BuildDuration'
+# app container of the task definitions, see `create_task_definition`
+APP_CONTAINER_NAME = 'container'
+# registrable keys of a described task definition
+TASK_DEFINITION_KEYS = (
+    'family', 'taskRoleArn', 'executionRoleArn', 'networkMode', 'containerDefinitions', 'volumes',
+    'placementConstraints', 'requiresCompatibilities', 'cpu', 'memory', 'ephemeralStorage',
+)
+
+
+def get_build_duration_metric(stack_name: str):
+    return cloudwatch.Metric(
+        namespace=BUILD_METRIC_NAMESPACE,
+        metric_name=BUILD_METRIC_NAME,
+        dimensions={'Pipeline': stack_name},
+        statistic='Average',
+    )
+
+
+def get_build_spec(config: StackConfig):
+    pre_build = [
+        'BUILD_STARTED_AT=$(date +%s)',
+        '$(aws ecr get-login --no-include-email --region $AWS_REGION)',
+        'IMAGE_LATEST=${REPOSITORY_URI}:latest',
+        'IMAGE_VERSION=${REPOSITORY_URI}:${CODEBUILD_RESOLVED_SOURCE_VERSION:0:7}',
+    ]
+    build = [
+        f'docker login -u="{config.docker_user}" -p="{config.docker_password}"',
+    ]
+    variables = {}
+
+    if config.build_cache_mode == 'registry':
+        # BuildKit layer cache kept in the stack repository, it survives the build hosts
+        buildx_file = f'buildx-{BUILDX_VERSION}.linux-amd64'
+        variables['DOCKER_CLI_EXPERIMENTAL'] = 'enabled'
+        pre_build += [
+            f'IMAGE_CACHE=${{REPOSITORY_URI}}:{BUILD_CACHE_TAG}',
+            f'BUILDX_URL={BUILDX_RELEASES_URL}/{BUILDX_VERSION}',
+            f'curl -sSLf ${{BUILDX_URL}}/{buildx_file} -o {buildx_file}',
+            # sha256 of the binary against the checksums of its release, no match fails the build
+            f'curl -sSLf ${{BUILDX_URL}}/checksums.txt | grep "{buildx_file}$" | sha256sum -c -',
+            'mkdir -p ~/.docker/cli-plugins',
+            f'install -m 755 {buildx_file} ~/.docker/cli-plugins/docker-buildx',
+            'docker buildx create --use --driver docker-container',
+        ]
+        build += [
+            'docker buildx build -f Dockerfile.prod -t ${IMAGE_LATEST} --load'
+            ' --cache-from type=registry,ref=${IMAGE_CACHE}'
+            ' --cache-to type=registry,ref=${IMAGE_CACHE},mode=max,image-manifest=true,oci-mediatypes=true .',
+        ]
+    elif config.build_cache_mode == 'local':
+        build += [
+            'docker build -f Dockerfile.prod -t ${IMAGE_LATEST} .',
+        ]
+    else:
+        raise ValueError(f'Invalid build_cache_mode {config.build_cache_mode}, choices: local, registry')
+
+    build += [
+        'docker tag ${IMAGE_LATEST} ${IMAGE_VERSION}',
+    ]
+    post_build = [
+        'docker push ${IMAGE_LATEST}',
+        'docker push ${IMAGE_VERSION}',
+        "printf '[{\"name\":\"container\",\"imageUri\":\"%s\"}]' ${IMAGE_VERSION} > imagedefinitions.json",
+    ]
+
+    if config.build_soci_index:
+        # SOCI index next to IMAGE_VERSION, Fargate lazy loads the image instead of pulling it whole
+        post_build += [
+            'curl -sSL https://github.com/awslabs/soci-snapshotter/releases/download/'
+            f'v{SOCI_VERSION}/soci-snapshotter-{SOCI_VERSION}-linux-amd64.tar.gz | tar -xz -C /usr/local/bin soci',
+            'ECR_PASSWORD=$(aws ecr get-login-password --region $AWS_REGION)',
+            f'ctr --address {CONTAINERD_ADDRESS} image pull --user AWS:${{ECR_PASSWORD}} ${{IMAGE_VERSION}}',
+            f'soci --address {CONTAINERD_ADDRESS} create ${{IMAGE_VERSION}}',
+            f'soci --address {CONTAINERD_ADDRESS} push --user AWS:${{ECR_PASSWORD}} ${{IMAGE_VERSION}}',
+            # pull/start times of the running tasks (previous deployment), to compare across builds
+            'TASK_ARNS=$(aws ecs list-tasks --cluster ${ECS_CLUSTER} --service-name ${ECS_SERVICE}'
+            ' --query taskArns --output text)',
+            'if [ -n "${TASK_ARNS}" ]; then aws ecs describe-tasks --cluster ${ECS_CLUSTER} --tasks ${TASK_ARNS}'
+            ' --query "tasks[].[pullStartedAt,pullStoppedAt,createdAt,startedAt]" --output text'
+            ' | awk \'{printf "task image pull: %.1fs start: %.1fs\\n", $2 - $1, $4 - $3}\'; fi',
+        ]
+
+    post_build += [
+        f'aws cloudwatch put-metric-data --namespace {BUILD_METRIC_NAMESPACE} --metric-name {BUILD_METRIC_NAME}'
+        ' --dimensions Pipeline=${PIPELINE_NAME} --unit Seconds --value $(( $(date +%s) - BUILD_STARTED_AT ))',
+    ]
+
+    build_spec = {
+        'version': '0.2',
+        'phases': {
+            'pre_build': {
+                'commands': pre_build
+            },
+            'build': {
+                'commands': build
+            },
+            'post_build': {
+                'commands': post_build
+            }
+        },
+        'artifacts': {
+            'files': [
+                'imagedefinitions.json'
+            ]
+        }
+    }
+    if variables:
+        build_spec['env'] = {'variables': variables}
+    return build_spec
+
+
+def get_release_build_spec():
+    """
+    Registers a revision of the release task definition with the image of the build (`imagedefinitions.json`,
+    the one the Deploy stage ships), runs it and fails unless the app container exits with 0.
+    """
+    task_definition_filter = (
+        f'.taskDefinition | .containerDefinitions |= map(if .name == "{APP_CONTAINER_NAME}" then .image = $image'
+        ' else . end) | {' + ', '.join(TASK_DEFINITION_KEYS) + '} | with_entries(select(.value != null))'
+    )
+    return {
+        'version': '0.2',
+        'phases': {
+            'build': {
+                'commands': [
+                    'IMAGE_VERSION=$(jq -r ".[0].imageUri" imagedefinitions.json)',
+                    'echo "release image ${IMAGE_VERSION}"',
+                    'aws ecs describe-task-definition --task-definition ${RELEASE_TASK_DEFINITION}'
+                    f' | jq --arg image "${{IMAGE_VERSION}}" \'{task_definition_filter}\' > task-definition.json',
+                    'RELEASE_TASK_ARN=$(aws ecs register-task-definition --cli-input-json file://task-definition.json'
+                    ' --query taskDefinition.taskDefinitionArn --output text)',
+                    'TASK_ARN=$(aws ecs run-task --cluster ${ECS_CLUSTER} --task-definition ${RELEASE_TASK_ARN}'
+                    ' --launch-type FARGATE --started-by ${PIPELINE_NAME}'
+                    ' --network-configuration "awsvpcConfiguration={subnets=[${SUBNET_IDS}],'
+                    'securityGroups=[${SECURITY_GROUP_IDS}],assignPublicIp=DISABLED}"'
+                    ' --query "tasks[0].taskArn" --output text)',
+                    'echo "release task ${TASK_ARN}"',
+                    '[ "${TASK_ARN}" != "None" ]',
+                    # `wait tasks-stopped` gives up after 10 minutes, the project timeout bounds the loop,
+                    # any other error (permissions, unknown task) fails the build
+                    'until WAIT_OUTPUT=$(aws ecs wait tasks-stopped --cluster ${ECS_CLUSTER} --tasks ${TASK_ARN} 2>&1);'
+                    ' do echo "${WAIT_OUTPUT}";'
+                    ' echo "${WAIT_OUTPUT}" | grep -q "Max attempts exceeded" || exit 1; done',
+                    'EXIT_CODE=$(aws ecs describe-tasks --cluster ${ECS_CLUSTER} --tasks ${TASK_ARN}'
+                    f' --query "tasks[0].containers[?name==\'{APP_CONTAINER_NAME}\'].exitCode" --output text)',
+                    'echo "release task exit code ${EXIT_CODE}"',
+                    '[ "${EXIT_CODE}" = "0" ]',
+                ]
+            },
+        },
+    }
+
+
+def create_release_project(
+    scope: core.Construct,
+    stack_name: str,
+    app_service: ecs.FargateService,
+    task_definition: ecs.TaskDefinition,
+    config: StackConfig,
+):
+    """
+    Project running the release task (migrations, statics) once per deployment, the tasks of the services
+    boot straight into serving.
+    """
+    subnet_ids = app_service.cluster.vpc.select_subnets(subnet_type=ec2.SubnetType.PRIVATE).subnet_ids
+    security_group_ids = [group.security_group_id for group in app_service.connections.security_groups]
+
+    project = codebuild.PipelineProject(
+        scope, 'release',
+        project_name=f'{stack_name}-release',
+        description=f'Release task of {stack_name}. Managed by AWS CDK.',
+        environment=codebuild.BuildEnvironment(
+            build_image=codebuild.LinuxBuildImage.AMAZON_LINUX_2_2,
+            compute_type=codebuild.ComputeType.SMALL,
+        ),
+        environment_variables={
+            'PIPELINE_NAME': codebuild.BuildEnvironmentVariable(value=stack_name),
+            'ECS_CLUSTER': codebuild.BuildEnvironmentVariable(value=app_service.cluster.cluster_name),
+            'RELEASE_TASK_DEFINITION': codebuild.BuildEnvironmentVariable(value=task_definition.task_definition_arn),
+            'SUBNET_IDS': codebuild.BuildEnvironmentVariable(value=core.Fn.join(',', subnet_ids)),
+            'SECURITY_GROUP_IDS': codebuild.BuildEnvironmentVariable(value=core.Fn.join(',', security_group_ids)),
+        },
+        timeout=core.Duration.minutes(config.release_timeout),
+        build_spec=codebuild.BuildSpec.from_object(get_release_build_spec()),
+    )
+    project.add_to_role_policy(
+        iam.PolicyStatement(
+            # every revision of the family, the project registers the one of the build
+            resources=[
+                core.Stack.of(scope).format_arn(
+                    service='ecs', resource='task-definition', resource_name=f'{task_definition.family}:*',
+                )
+            ],
+            actions=['ecs:RunTask'],
+        )
+    )
+    project.add_to_role_policy(
+        iam.PolicyStatement(
+            # no resource level permissions
+            resources=['*'],
+            actions=['ecs:DescribeTasks', 'ecs:DescribeTaskDefinition', 'ecs:RegisterTaskDefinition'],
+        )
+    )
+    task_definition.task_role.grant_pass_role(project)
+    task_definition.obtain_execution_role().grant_pass_role(project)
+    return project
+
 
 def create_pipeline(
     scope: core.Construct,
@@ -17,57 +236,44 @@ def create_pipeline(
     ecr_repository: ecr.Repository,
     app_service: ecs.FargateService,
     config: StackConfig,
-    worker_service: ecs.FargateService = None,
+    worker_services: Dict[str, ecs.FargateService] = None,
+    release_task_definition: ecs.TaskDefinition = None,
 ):
 
+    compute_type = getattr(codebuild.ComputeType, config.build_compute_type, None)
+    if not compute_type:
+        raise ValueError(f'Invalid build_compute_type {config.build_compute_type}, choices: SMALL, MEDIUM, LARGE, X2_LARGE')
+
     project = codebuild.PipelineProject(
         scope, 'build',
         project_name=stack_name,
         description=f'Build project for {stack_name}. Managed by AWS CDK.',
         environment=codebuild.BuildEnvironment(
-            privileged=True, build_image=codebuild.LinuxBuildImage.AMAZON_LINUX_2_2
+            privileged=True,
+            build_image=codebuild.LinuxBuildImage.AMAZON_LINUX_2_2,
+            compute_type=compute_type,
         ),
         environment_variables={
             'REPOSITORY_URI': codebuild.BuildEnvironmentVariable(value=ecr_repository.repository_uri),
+            'PIPELINE_NAME': codebuild.BuildEnvironmentVariable(value=stack_name),
+            'ECS_CLUSTER': codebuild.BuildEnvironmentVariable(value=app_service.cluster.cluster_name),
+            'ECS_SERVICE': codebuild.BuildEnvironmentVariable(value=app_service.service_name),
         },
         cache=codebuild.Cache.local(
             codebuild.LocalCacheMode.DOCKER_LAYER,
             codebuild.LocalCacheMode.CUSTOM,
             codebuild.LocalCacheMode.SOURCE
         ),
-        build_spec=codebuild.BuildSpec.from_object({
-            'version': '0.2',
-            'phases': {
-                'pre_build': {
-                    'commands': [
-                        '$(aws ecr get-login --no-include-email --region $AWS_REGION)',
-                        'IMAGE_LATEST=${REPOSITORY_URI}:latest',
-                        'IMAGE_VERSION=${REPOSITORY_URI}:${CODEBUILD_RESOLVED_SOURCE_VERSION:0:7}'
-                    ]
-                },
-                'build': {
-                    'commands': [
-                        f'docker login -u="{config.docker_user}" -p="{config.docker_password}"',
-                        'docker build -f Dockerfile.prod -t ${IMAGE_LATEST} .',
-                        'docker tag ${IMAGE_LATEST} ${IMAGE_VERSION}'
-                    ]
-                },
-                'post_build': {
-                    'commands': [
-                        'docker push ${IMAGE_LATEST}',
-                        'docker push ${IMAGE_VERSION}',
-                        "printf '[{\"name\":\"container\",\"imageUri\":\"%s\"}]' ${IMAGE_VERSION} > imagedefinitions.json"
-                    ]
-                }
-            },
-            'artifacts': {
-                'files': [
-                    'imagedefinitions.json'
-                ]
-            }
-        })
+        build_spec=codebuild.BuildSpec.from_object(get_build_spec(config)),
     )
     ecr_repository.grant_pull_push(project)
+    cloudwatch.Metric.grant_put_metric_data(project)
+    project.add_to_role_policy(
+        iam.PolicyStatement(
+            resources=['*'],
+            actions=['ecs:ListTasks', 'ecs:DescribeTasks'],
+        )
+    )
     source_output = codepipeline.Artifact()
     source_action = actions.GitHubSourceAction(
         action_name='Source',
@@ -96,10 +302,10 @@ def create_pipeline(
             input=build_output,
         )
     ]
-    if worker_service:
+    for pool_name, worker_service in (worker_services or {}).items():
         deploy_actions.append(
             actions.EcsDeployAction(
-                action_name='Worker',
+                action_name=pool_name.title(),
                 service=worker_service,
                 input=build_output,
             )
@@ -129,6 +335,18 @@ def create_pipeline(
                 )
             ]
         )
+    if release_task_definition:
+        # after the approval, migrations only run for approved deployments
+        pipeline.add_stage(
+            stage_name='Release',
+            actions=[
+                actions.CodeBuildAction(
+                    action_name='Migrate',
+                    project=create_release_project(scope, stack_name, app_service, release_task_definition, config),
+                    input=build_output,
+                )
+            ]
+        )
     pipeline.add_stage(
         stage_name='Deploy',
         actions=deploy_actions,
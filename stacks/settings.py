@@ -1,4 +1,5 @@
 import json
+import re
 from typing import List
 
 import environ
@@ -8,6 +9,65 @@ env = environ.Env()
 AWS_ACCOUNT_ID = env.str('AWS_ACCOUNT_ID')
 AWS_DEFAULT_REGION = env.str('AWS_DEFAULT_REGION')
 
+# Stack to synthesize, the `stack` CDK context value takes precedence.
+# An empty value synthesizes every entry in `cdk.stacks.json`.
+CDK_STACK = env.str('CDK_STACK', default='')
+
+# Worker processes used to synthesize every stack, the `workers` CDK context value takes precedence.
+CDK_SYNTH_WORKERS = env.int('CDK_SYNTH_WORKERS', default=1)
+
+# Directory of the incremental synth cache, the `cache` CDK context value takes precedence.
+# An empty value synthesizes every stack from scratch.
+CDK_SYNTH_CACHE = env.str('CDK_SYNTH_CACHE', default='')
+
+
+# roles of the other task definitions and services of a stack
+RESERVED_WORKER_POOL_NAMES = ('app', 'release', 'locust-master', 'locust-worker')
+
+
+class WorkerPool(object):
+    """Celery worker service of a set of queues, `worker_pools` entry of a stack."""
+    name: str = None
+    queues: list = None
+    concurrency: int = None
+    cpu: int = 512
+    memory: int = 1024
+    ephemeral_storage: int = None
+    desired_count: int = 1
+    max_count: int = 10
+    scale_to_zero: bool = False
+    on_demand_base: int = 0
+    on_demand_weight: int = 1
+    spot_weight: int = 0
+
+    def __init__(
+        self,
+        name: str,
+        queues: list = None,
+        concurrency: int = None,
+        cpu: int = 512,
+        memory: int = 1024,
+        ephemeral_storage: int = None,
+        desired_count: int = 1,
+        max_count: int = 10,
+        scale_to_zero: bool = False,
+        on_demand_base: int = 0,
+        on_demand_weight: int = 1,
+        spot_weight: int = 0,
+    ):
+        self.name = name
+        self.queues = queues
+        self.concurrency = concurrency
+        self.cpu = cpu
+        self.memory = memory
+        self.ephemeral_storage = ephemeral_storage
+        self.desired_count = desired_count
+        self.max_count = max_count
+        self.scale_to_zero = scale_to_zero
+        self.on_demand_base = on_demand_base
+        self.on_demand_weight = on_demand_weight
+        self.spot_weight = spot_weight
+
 
 class StackConfig(object):
     stack_name: str = None
@@ -35,6 +95,102 @@ class StackConfig(object):
     desired_worker_count: int = None
     docker_user: str = None
     docker_password: str = None
+    app_cpu: int = 512
+    app_memory: int = 1024
+    app_ephemeral_storage: int = None
+    worker_cpu: int = 512
+    worker_memory: int = 1024
+    worker_ephemeral_storage: int = None
+    datadog_cpu: int = 12
+    datadog_memory: int = 256
+    app_max_count: int = 10
+    app_requests_per_target: int = None
+    app_target_response_time: float = None
+    app_scaling_schedules: list = None
+    worker_max_count: int = 10
+    worker_queues: list = None
+    worker_queue_scaling: bool = False
+    worker_queue_threshold: int = 100
+    worker_scale_to_zero: bool = False
+    app_on_demand_base: int = 0
+    app_on_demand_weight: int = 1
+    app_spot_weight: int = 0
+    worker_on_demand_base: int = 0
+    worker_on_demand_weight: int = 1
+    worker_spot_weight: int = 0
+    cache_replication: bool = False
+    cache_replicas_per_shard: int = 1
+    cache_shards: int = 1
+    cache_cluster_mode: bool = False
+    cache_multi_az: bool = False
+    database_proxy: bool = False
+    database_read_replicas: int = 0
+    database_replica_size: str = None
+    cdn_enabled: bool = False
+    cdn_certificate_arn: str = None
+    cdn_static_ttl: int = 31536000
+    cdn_app_max_ttl: int = 3600
+    database_max_connections: int = None
+    database_tuned_parameters: bool = False
+    database_storage_type: str = 'gp2'
+    database_iops: int = None
+    database_storage_throughput: int = None
+    database_max_allocated_storage: int = None
+    vpc_nat_per_az: bool = False
+    vpc_endpoints: list = None
+    build_cache_mode: str = 'local'
+    build_compute_type: str = 'SMALL'
+    build_soci_index: bool = False
+    datadog_agent_image: str = 'datadog/agent:7.49.1'
+    datadog_sockets: bool = False
+    monitoring_enabled: bool = False
+    alarm_topic_arn: str = None
+    alarm_latency_p99: float = 2.0
+    alarm_5xx_count: int = 10
+    alarm_service_cpu: int = 85
+    alarm_service_memory: int = 85
+    alarm_database_cpu: int = 80
+    alarm_database_connections: int = 80
+    alarm_database_latency: float = 0.02
+    alarm_cache_cpu: int = 75
+    alarm_cache_evictions: int = 100
+    alarm_cache_hit_ratio: int = None
+    alarm_queue_length: int = 1000
+    log_router: str = None
+    log_router_image: str = 'public.ecr.aws/aws-observability/aws-for-fluent-bit:2.31.12'
+    log_router_cpu: int = 64
+    log_router_memory: int = 128
+    log_flush_seconds: int = 5
+    log_buffer_limit: int = None
+    log_non_blocking: bool = False
+    log_max_buffer_size: str = '25m'
+    log_exclude_pattern: str = None
+    log_sample_pattern: str = None
+    log_sample_rate: int = 10
+    lint_strict: bool = False
+    lint_rules: dict = None
+    lint_suppressions: dict = None
+    load_test_enabled: bool = False
+    load_test_image: str = 'locustio/locust:2.20.0'
+    load_test_scenario: str = 'locustfile.py'
+    load_test_host: str = None
+    load_test_workers: int = 2
+    load_test_max_workers: int = 10
+    load_test_cpu: int = 1024
+    load_test_memory: int = 2048
+    load_test_users: int = 100
+    load_test_spawn_rate: int = 10
+    load_test_duration: int = 300
+    database_engine: str = 'postgres'
+    database_aurora_version: str = '15.4'
+    database_min_capacity: float = 0.5
+    database_max_capacity: float = 4
+    cache_roles: dict = None
+    worker_pools: list = None
+    release_command: list = None
+    release_timeout: int = 30
+    service_discovery: bool = False
+    service_connect: bool = False
 
     def __init__(
         self,
@@ -63,6 +219,102 @@ class StackConfig(object):
         desired_worker_count: int,
         docker_user: str,
         docker_password: str,
+        app_cpu: int = 512,
+        app_memory: int = 1024,
+        app_ephemeral_storage: int = None,
+        worker_cpu: int = 512,
+        worker_memory: int = 1024,
+        worker_ephemeral_storage: int = None,
+        datadog_cpu: int = 12,
+        datadog_memory: int = 256,
+        app_max_count: int = 10,
+        app_requests_per_target: int = None,
+        app_target_response_time: float = None,
+        app_scaling_schedules: list = None,
+        worker_max_count: int = 10,
+        worker_queues: list = None,
+        worker_queue_scaling: bool = False,
+        worker_queue_threshold: int = 100,
+        worker_scale_to_zero: bool = False,
+        app_on_demand_base: int = 0,
+        app_on_demand_weight: int = 1,
+        app_spot_weight: int = 0,
+        worker_on_demand_base: int = 0,
+        worker_on_demand_weight: int = 1,
+        worker_spot_weight: int = 0,
+        cache_replication: bool = False,
+        cache_replicas_per_shard: int = 1,
+        cache_shards: int = 1,
+        cache_cluster_mode: bool = False,
+        cache_multi_az: bool = False,
+        database_proxy: bool = False,
+        database_read_replicas: int = 0,
+        database_replica_size: str = None,
+        cdn_enabled: bool = False,
+        cdn_certificate_arn: str = None,
+        cdn_static_ttl: int = 31536000,
+        cdn_app_max_ttl: int = 3600,
+        database_max_connections: int = None,
+        database_tuned_parameters: bool = False,
+        database_storage_type: str = 'gp2',
+        database_iops: int = None,
+        database_storage_throughput: int = None,
+        database_max_allocated_storage: int = None,
+        vpc_nat_per_az: bool = False,
+        vpc_endpoints: list = None,
+        build_cache_mode: str = 'local',
+        build_compute_type: str = 'SMALL',
+        build_soci_index: bool = False,
+        datadog_agent_image: str = 'datadog/agent:7.49.1',
+        datadog_sockets: bool = False,
+        monitoring_enabled: bool = False,
+        alarm_topic_arn: str = None,
+        alarm_latency_p99: float = 2.0,
+        alarm_5xx_count: int = 10,
+        alarm_service_cpu: int = 85,
+        alarm_service_memory: int = 85,
+        alarm_database_cpu: int = 80,
+        alarm_database_connections: int = 80,
+        alarm_database_latency: float = 0.02,
+        alarm_cache_cpu: int = 75,
+        alarm_cache_evictions: int = 100,
+        alarm_cache_hit_ratio: int = None,
+        alarm_queue_length: int = 1000,
+        log_router: str = None,
+        log_router_image: str = 'public.ecr.aws/aws-observability/aws-for-fluent-bit:2.31.12',
+        log_router_cpu: int = 64,
+        log_router_memory: int = 128,
+        log_flush_seconds: int = 5,
+        log_buffer_limit: int = None,
+        log_non_blocking: bool = False,
+        log_max_buffer_size: str = '25m',
+        log_exclude_pattern: str = None,
+        log_sample_pattern: str = None,
+        log_sample_rate: int = 10,
+        lint_strict: bool = False,
+        lint_rules: dict = None,
+        lint_suppressions: dict = None,
+        load_test_enabled: bool = False,
+        load_test_image: str = 'locustio/locust:2.20.0',
+        load_test_scenario: str = 'locustfile.py',
+        load_test_host: str = None,
+        load_test_workers: int = 2,
+        load_test_max_workers: int = 10,
+        load_test_cpu: int = 1024,
+        load_test_memory: int = 2048,
+        load_test_users: int = 100,
+        load_test_spawn_rate: int = 10,
+        load_test_duration: int = 300,
+        database_engine: str = 'postgres',
+        database_aurora_version: str = '15.4',
+        database_min_capacity: float = 0.5,
+        database_max_capacity: float = 4,
+        cache_roles: dict = None,
+        worker_pools: list = None,
+        release_command: list = None,
+        release_timeout: int = 30,
+        service_discovery: bool = False,
+        service_connect: bool = False,
     ):
         self.stack_name = stack_name
         self.stack_label = stack_label
@@ -89,6 +341,151 @@ class StackConfig(object):
         self.desired_worker_count = desired_worker_count
         self.docker_user = docker_user
         self.docker_password = docker_password
+        self.app_cpu = app_cpu
+        self.app_memory = app_memory
+        self.app_ephemeral_storage = app_ephemeral_storage
+        self.worker_cpu = worker_cpu
+        self.worker_memory = worker_memory
+        self.worker_ephemeral_storage = worker_ephemeral_storage
+        self.datadog_cpu = datadog_cpu
+        self.datadog_memory = datadog_memory
+        self.app_max_count = app_max_count
+        self.app_requests_per_target = app_requests_per_target
+        self.app_target_response_time = app_target_response_time
+        self.app_scaling_schedules = app_scaling_schedules
+        self.worker_max_count = worker_max_count
+        self.worker_queues = worker_queues
+        self.worker_queue_scaling = worker_queue_scaling
+        self.worker_queue_threshold = worker_queue_threshold
+        self.worker_scale_to_zero = worker_scale_to_zero
+        self.app_on_demand_base = app_on_demand_base
+        self.app_on_demand_weight = app_on_demand_weight
+        self.app_spot_weight = app_spot_weight
+        self.worker_on_demand_base = worker_on_demand_base
+        self.worker_on_demand_weight = worker_on_demand_weight
+        self.worker_spot_weight = worker_spot_weight
+        self.cache_replication = cache_replication
+        self.cache_replicas_per_shard = cache_replicas_per_shard
+        self.cache_shards = cache_shards
+        self.cache_cluster_mode = cache_cluster_mode
+        self.cache_multi_az = cache_multi_az
+        self.database_proxy = database_proxy
+        self.database_read_replicas = database_read_replicas
+        self.database_replica_size = database_replica_size
+        self.cdn_enabled = cdn_enabled
+        self.cdn_certificate_arn = cdn_certificate_arn
+        self.cdn_static_ttl = cdn_static_ttl
+        self.cdn_app_max_ttl = cdn_app_max_ttl
+        self.database_max_connections = database_max_connections
+        self.database_tuned_parameters = database_tuned_parameters
+        self.database_storage_type = database_storage_type
+        self.database_iops = database_iops
+        self.database_storage_throughput = database_storage_throughput
+        self.database_max_allocated_storage = database_max_allocated_storage
+        self.vpc_nat_per_az = vpc_nat_per_az
+        self.vpc_endpoints = vpc_endpoints
+        self.build_cache_mode = build_cache_mode
+        self.build_compute_type = build_compute_type
+        self.build_soci_index = build_soci_index
+        self.datadog_agent_image = datadog_agent_image
+        self.datadog_sockets = datadog_sockets
+        self.monitoring_enabled = monitoring_enabled
+        self.alarm_topic_arn = alarm_topic_arn
+        self.alarm_latency_p99 = alarm_latency_p99
+        self.alarm_5xx_count = alarm_5xx_count
+        self.alarm_service_cpu = alarm_service_cpu
+        self.alarm_service_memory = alarm_service_memory
+        self.alarm_database_cpu = alarm_database_cpu
+        self.alarm_database_connections = alarm_database_connections
+        self.alarm_database_latency = alarm_database_latency
+        self.alarm_cache_cpu = alarm_cache_cpu
+        self.alarm_cache_evictions = alarm_cache_evictions
+        self.alarm_cache_hit_ratio = alarm_cache_hit_ratio
+        self.alarm_queue_length = alarm_queue_length
+        self.log_router = log_router
+        self.log_router_image = log_router_image
+        self.log_router_cpu = log_router_cpu
+        self.log_router_memory = log_router_memory
+        self.log_flush_seconds = log_flush_seconds
+        self.log_buffer_limit = log_buffer_limit
+        self.log_non_blocking = log_non_blocking
+        self.log_max_buffer_size = log_max_buffer_size
+        self.log_exclude_pattern = log_exclude_pattern
+        self.log_sample_pattern = log_sample_pattern
+        self.log_sample_rate = log_sample_rate
+        self.lint_strict = lint_strict
+        self.lint_rules = lint_rules
+        self.lint_suppressions = lint_suppressions
+        self.load_test_enabled = load_test_enabled
+        self.load_test_image = load_test_image
+        self.load_test_scenario = load_test_scenario
+        self.load_test_host = load_test_host
+        self.load_test_workers = load_test_workers
+        self.load_test_max_workers = load_test_max_workers
+        self.load_test_cpu = load_test_cpu
+        self.load_test_memory = load_test_memory
+        self.load_test_users = load_test_users
+        self.load_test_spawn_rate = load_test_spawn_rate
+        self.load_test_duration = load_test_duration
+        self.database_engine = database_engine
+        self.database_aurora_version = database_aurora_version
+        self.database_min_capacity = database_min_capacity
+        self.database_max_capacity = database_max_capacity
+        self.cache_roles = cache_roles
+        self.worker_pools = worker_pools
+        self.release_command = release_command
+        self.release_timeout = release_timeout
+        self.service_discovery = service_discovery
+        self.service_connect = service_connect
+
+    def get_worker_pools(self) -> List[WorkerPool]:
+        # without `worker_pools` the `worker_` keys define a single `worker` pool
+        if not self.worker_pools:
+            pools = [
+                WorkerPool(
+                    name='worker',
+                    queues=self.worker_queues,
+                    cpu=self.worker_cpu,
+                    memory=self.worker_memory,
+                    ephemeral_storage=self.worker_ephemeral_storage,
+                    desired_count=self.desired_worker_count,
+                    max_count=self.worker_max_count,
+                    scale_to_zero=self.worker_scale_to_zero,
+                    on_demand_base=self.worker_on_demand_base,
+                    on_demand_weight=self.worker_on_demand_weight,
+                    spot_weight=self.worker_spot_weight,
+                )
+            ]
+        else:
+            pools = []
+            for pool in self.worker_pools:
+                unknown_keys = set(pool) - set(WorkerPool.__annotations__)
+                if unknown_keys:
+                    raise ValueError(
+                        f'Unknown keys {", ".join(sorted(unknown_keys))} of worker pool '
+                        f'{pool.get("name")} of {self.stack_name}'
+                    )
+                pools.append(WorkerPool(**pool))
+
+        names = [pool.name for pool in pools]
+        for name in names:
+            if not re.match(r'^[a-z][a-z0-9-]*$', name):
+                raise ValueError(f'Invalid worker pool name {name} of {self.stack_name}, lowercase letters, digits and -')
+            if name in RESERVED_WORKER_POOL_NAMES:
+                raise ValueError(
+                    f'Reserved worker pool name {name} of {self.stack_name}, '
+                    f'not one of {", ".join(RESERVED_WORKER_POOL_NAMES)}'
+                )
+        if len(set(names)) < len(names):
+            raise ValueError(f'Duplicated worker pool names of {self.stack_name}: {", ".join(names)}')
+        # the queue length Lambda reads a single Redis (LLEN), Celery can't use Redis Cluster as a broker either
+        if self.worker_queue_scaling and self.cache_cluster_mode:
+            raise ValueError(f'worker_queue_scaling of {self.stack_name} needs a broker without cache_cluster_mode')
+        for pool in pools:
+            # a service without tasks has no CPU metric, only the queue length brings it back
+            if pool.scale_to_zero and not self.worker_queue_scaling:
+                raise ValueError(f'Worker pool {pool.name} of {self.stack_name} scales to zero, it needs worker_queue_scaling')
+        return pools
 
     @classmethod
     def get_configs(cls, config_file='./cdk.stacks.json') -> List["StackConfig"]:
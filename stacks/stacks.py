@@ -5,24 +5,47 @@ from aws_cdk import (
     core,
 )
 
+from stacks.lint import add_lint_rules
 from stacks.resources.ecs_services import (
+    APP_PORT,
     create_cluster,
     create_services_policy,
     create_task_definition,
     create_fargate_service,
+    get_capacity_provider_strategy,
+    get_internal_environment,
+    create_service_scaling,
+    configure_app_scaling,
+    configure_queue_scaling,
+)
+from stacks.resources.loadtest import create_load_test
+from stacks.resources.monitoring import (
+    create_alarms,
+    create_dashboard,
+    create_log_group,
+    create_queue_length_publisher,
+    get_queue_length_metric,
 )
-from stacks.resources.monitoring import create_log_group
 from stacks.resources.network import (
     create_vpc,
     create_load_balancer,
     configure_load_balancing,
     configure_domain,
+    create_distribution,
 )
 from stacks.resources.storage import (
     create_bucket,
-    create_redis_cache,
-    create_rds_instance,
+    create_logs_bucket,
+    create_redis_caches,
+    create_database,
+    create_rds_proxy,
+    create_rds_proxy_reader_endpoint,
+    create_rds_read_replicas,
+    get_database_environment,
     create_ecr_repository,
+    get_cache_endpoints,
+    get_cache_environment,
+    get_broker_cache,
 )
 from stacks.resources.workflow import create_pipeline
 from stacks.settings import StackConfig
@@ -32,14 +55,17 @@ class VPCStack(core.Stack):
     vpc_name: str = None
     vpc: ec2.IVpc = None
 
-    def __init__(self, scope: core.Construct, id: str, vpc_name: str, **kwargs) -> None:
+    def __init__(self, scope: core.Construct, id: str, vpc_name: str, config: StackConfig = None, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
         self.vpc_name = vpc_name
+        self.config = config
         self.synth()
+        if config:
+            add_lint_rules(self, config)
 
     def synth(self):
-        self.vpc = create_vpc(self, self.vpc_name)
+        self.vpc = create_vpc(self, self.vpc_name, self.config)
 
     def get_vpc(self):
         return self.vpc
@@ -52,22 +78,29 @@ class PlatformStack(core.Stack):
         self.vpc = vpc
         self.config = config
         self.synth()
+        add_lint_rules(self, config)
 
     def synth(self):
         #  1.  ECS : Cluster
-        ecs_cluster = create_cluster(self, self.stack_name, self.vpc)
+        ecs_cluster = create_cluster(
+            self, self.stack_name, self.vpc,
+            cloud_map_namespace=self.config.service_discovery,
+            service_connect=self.config.service_connect,
+        )
+        internal_discovery = self.config.service_discovery or self.config.service_connect
 
         #  2.  S3 - BUCKET
         s3_bucket = create_bucket(self, self.stack_name)
 
         #  3.  LOGGING
         log_group = create_log_group(self, self.stack_name)
+        log_bucket = create_logs_bucket(self, self.stack_name) if self.config.log_router == 's3' else None
 
         #  4.  IAM  POLICY  FOR  SECRETS
         policy = create_services_policy(self, self.stack_name, self.config.kms_key_uuid)
 
-        #  5.  REDIS CACHE
-        cache = create_redis_cache(
+        #  5.  REDIS CACHE / one per role
+        caches = create_redis_caches(
             scope=self,
             vpc=self.vpc,
             stack_name=self.stack_name,
@@ -75,18 +108,38 @@ class PlatformStack(core.Stack):
         )
 
         #  6.  DATABASE
-        database = create_rds_instance(
+        database = create_database(
             scope=self,
             stack_name=self.stack_name,
             vpc=self.vpc,
             config=self.config,
             ecs_cluster=ecs_cluster,
         )
+        database_proxy = None
+        database_proxy_reader = None
+        if self.config.database_proxy:
+            database_proxy = create_rds_proxy(self, self.stack_name, self.vpc, database)
+            database_proxy_reader = create_rds_proxy_reader_endpoint(
+                self, self.stack_name, self.vpc, self.config, database, database_proxy,
+            )
+        database_replicas = create_rds_read_replicas(
+            scope=self,
+            stack_name=self.stack_name,
+            vpc=self.vpc,
+            config=self.config,
+            database=database,
+        )
 
         #  7.  ECR
         ecr_repository = create_ecr_repository(self, self.stack_name)
 
-        #  8.  TASK DEFINITIONS: app / worker
+        services_environment = {
+            **get_cache_environment(caches),
+            **get_database_environment(database, database_proxy, database_replicas, database_proxy_reader),
+            **(get_internal_environment(self.stack_name, ['app']) if internal_discovery else {}),
+        }
+
+        #  8.  TASK DEFINITIONS: app
         app_task_definition = create_task_definition(
             scope=self,
             stack_name=self.stack_name,
@@ -97,21 +150,35 @@ class PlatformStack(core.Stack):
             service_name=self.stack_name,
             role='app',
             config=self.config,
-        )
-        worker_task_definition = create_task_definition(
-            scope=self,
-            stack_name=self.stack_name,
-            ecr_repository=ecr_repository,
-            log_group=log_group,
-            policy=policy,
-            s3_bucket=s3_bucket,
-            config=self.config,
-            service_name=f'{self.stack_name}-worker',
-            role='worker',
-            command=['/worker'],
+            environment=services_environment,
+            cpu=self.config.app_cpu,
+            memory=self.config.app_memory,
+            ephemeral_storage=self.config.app_ephemeral_storage,
+            log_bucket=log_bucket,
         )
 
-        #  9.  ECS : Services
+        #  8.1  RELEASE TASK: migrations and statics, run by the pipeline before the deployment
+        release_task_definition = None
+        if self.config.release_command:
+            release_task_definition = create_task_definition(
+                scope=self,
+                stack_name=self.stack_name,
+                ecr_repository=ecr_repository,
+                log_group=log_group,
+                policy=policy,
+                s3_bucket=s3_bucket,
+                config=self.config,
+                service_name=f'{self.stack_name}-release',
+                role='release',
+                command=self.config.release_command,
+                environment=services_environment,
+                cpu=self.config.app_cpu,
+                memory=self.config.app_memory,
+                ephemeral_storage=self.config.app_ephemeral_storage,
+                log_bucket=log_bucket,
+            )
+
+        #  9.  ECS : Services / app
         app_service = create_fargate_service(
             scope=self,
             service_name=self.stack_name,
@@ -120,23 +187,106 @@ class PlatformStack(core.Stack):
             desired_count=self.config.desired_app_count,
             has_health_check=True,
             role='app',
+            capacity_provider_strategy=get_capacity_provider_strategy(
+                on_demand_base=self.config.app_on_demand_base,
+                on_demand_weight=self.config.app_on_demand_weight,
+                spot_weight=self.config.app_spot_weight,
+            ),
+            lazy_loading=self.config.build_soci_index,
+            discoverable=internal_discovery,
+            service_connect=self.config.service_connect,
         )
-        worker_service = create_fargate_service(
-            scope=self,
-            service_name=f'{self.stack_name}-worker',
-            ecs_cluster=ecs_cluster,
-            task_definition=worker_task_definition,
-            desired_count=self.config.desired_worker_count,
-            has_health_check=False,
-            role='worker',
+        app_scaling = create_service_scaling(
+            service=app_service,
+            min_capacity=self.config.desired_app_count,
+            max_capacity=self.config.app_max_count,
         )
 
+        #  9.1  WORKER POOLS: task definition, service and scaling per pool
+        worker_pools = self.config.get_worker_pools()
+        worker_task_definitions, worker_services = dict(), dict()
+        for pool in worker_pools:
+            pool_environment = dict(services_environment, WORKER_POOL=pool.name)
+            if pool.queues:
+                pool_environment['WORKER_QUEUES'] = ','.join(pool.queues)
+            if pool.concurrency:
+                pool_environment['WORKER_CONCURRENCY'] = str(pool.concurrency)
+            worker_task_definitions[pool.name] = create_task_definition(
+                scope=self,
+                stack_name=self.stack_name,
+                ecr_repository=ecr_repository,
+                log_group=log_group,
+                policy=policy,
+                s3_bucket=s3_bucket,
+                config=self.config,
+                service_name=f'{self.stack_name}-{pool.name}',
+                role=pool.name,
+                command=['/worker'],
+                environment=pool_environment,
+                cpu=pool.cpu,
+                memory=pool.memory,
+                ephemeral_storage=pool.ephemeral_storage,
+                log_bucket=log_bucket,
+            )
+            worker_services[pool.name] = create_fargate_service(
+                scope=self,
+                service_name=f'{self.stack_name}-{pool.name}',
+                ecs_cluster=ecs_cluster,
+                task_definition=worker_task_definitions[pool.name],
+                desired_count=pool.desired_count,
+                has_health_check=False,
+                role=pool.name,
+                capacity_provider_strategy=get_capacity_provider_strategy(
+                    on_demand_base=pool.on_demand_base,
+                    on_demand_weight=pool.on_demand_weight,
+                    spot_weight=pool.spot_weight,
+                ),
+                lazy_loading=self.config.build_soci_index,
+                service_connect=self.config.service_connect,
+            )
+            if internal_discovery:
+                # internal calls to the app skip the load balancer
+                app_service.connections.allow_from(worker_services[pool.name], ec2.Port.tcp(APP_PORT))
+            worker_scaling = create_service_scaling(
+                service=worker_services[pool.name],
+                min_capacity=0 if pool.scale_to_zero else pool.desired_count,
+                max_capacity=pool.max_count,
+                cpu_scaling=not self.config.worker_queue_scaling,
+            )
+            if self.config.worker_queue_scaling:
+                configure_queue_scaling(
+                    scaling=worker_scaling,
+                    queue_length=get_queue_length_metric(self.stack_name, pool.name),
+                    min_capacity=0 if pool.scale_to_zero else pool.desired_count,
+                    max_capacity=pool.max_count,
+                    threshold=self.config.worker_queue_threshold,
+                )
+
+        #  9.2  WORKER QUEUE LENGTH
+        if self.config.worker_queue_scaling:
+            redis_host, _, redis_port = get_cache_endpoints(get_broker_cache(caches))
+            create_queue_length_publisher(
+                scope=self,
+                stack_name=self.stack_name,
+                vpc=self.vpc,
+                redis_host=redis_host,
+                redis_port=redis_port,
+                queue_pools={pool.name: pool.queues or ['celery'] for pool in worker_pools},
+            )
+
         database.connections.allow_default_port_from(ecs_cluster)
         database.connections.allow_from(app_service, port_range=ec2.Port.tcp(5432))
-        database.connections.allow_from(worker_service, port_range=ec2.Port.tcp(5432))
         database.secret.grant_read(app_task_definition.obtain_execution_role())
-        database.secret.grant_read(worker_task_definition.obtain_execution_role())
+        if release_task_definition:
+            database.secret.grant_read(release_task_definition.obtain_execution_role())
+        for pool_name, worker_service in worker_services.items():
+            database.connections.allow_from(worker_service, port_range=ec2.Port.tcp(5432))
+            database.secret.grant_read(worker_task_definitions[pool_name].obtain_execution_role())
         database.connections.allow_from_any_ipv4(ec2.Port.tcp(5432))  # It makes accesible in internet
+        for database_endpoint in [database_proxy, *database_replicas]:
+            if database_endpoint:
+                for service in [app_service, *worker_services.values()]:
+                    database_endpoint.connections.allow_from(service, port_range=ec2.Port.tcp(5432))
 
         s3_bucket.grant_public_access()
 
@@ -150,18 +300,57 @@ class PlatformStack(core.Stack):
             self, 'certificate', certificate_key
         )
         load_balancer = create_load_balancer(self, self.vpc)
-        configure_load_balancing(load_balancer, app_service, ssl_certificate=certificate)
+        target_group = configure_load_balancing(load_balancer, app_service, ssl_certificate=certificate)
+        configure_app_scaling(app_scaling, target_group, self.config)
 
-        #  11.  DNS RECORD
-        configure_domain(scope=self, load_balancer=load_balancer, config=self.config)
+        #  11.  CDN / DNS RECORD
+        distribution = None
+        if self.config.cdn_enabled:
+            distribution = create_distribution(
+                scope=self,
+                stack_name=self.stack_name,
+                config=self.config,
+                s3_bucket=s3_bucket,
+            )
+        configure_domain(
+            scope=self,
+            load_balancer=load_balancer,
+            config=self.config,
+            distribution=distribution,
+        )
 
         #  12.  BUILD PIPELINE
         pipeline = create_pipeline(
             self,
             stack_name=self.stack_name,
             app_service=app_service,
-            worker_service=worker_service,
+            worker_services=worker_services,
+            release_task_definition=release_task_definition,
             config=self.config,
             ecr_repository=ecr_repository,
         )
 
+        #  13.  DASHBOARD / ALARMS
+        if self.config.monitoring_enabled:
+            monitored_resources = dict(
+                load_balancer=load_balancer,
+                services={'app': app_service, **worker_services},
+                database=database,
+                caches=caches,
+                queue_lengths={
+                    pool.name: get_queue_length_metric(self.stack_name, pool.name) for pool in worker_pools
+                } if self.config.worker_queue_scaling else None,
+            )
+            create_dashboard(self, self.stack_name, **monitored_resources)
+            create_alarms(self, self.stack_name, self.config, **monitored_resources)
+
+        #  14.  LOAD TEST
+        if self.config.load_test_enabled:
+            create_load_test(
+                scope=self,
+                stack_name=self.stack_name,
+                ecs_cluster=ecs_cluster,
+                s3_bucket=s3_bucket,
+                log_group=log_group,
+                config=self.config,
+            )
@@ -1,21 +1,105 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import pkg_resources
 from aws_cdk import core
 
 from stacks.settings import StackConfig
 from stacks.stacks import PlatformStack, VPCStack
 from stacks import settings
 
+VPC_STACK_SUFFIX = '-vpc'
+MANIFEST_FILE = 'manifest.json'
+TREE_ARTIFACT_TYPE = 'cdk:tree'
+# context values of this app, they don't change the templates
+SYNTH_CONTEXT_KEYS = ('stack', 'workers', 'cache')
+# every worker starts its own jsii runtime (a few seconds), below this it costs more than it saves
+MIN_ENTRIES_PER_SYNTH_WORKER = 4
+
+
+def get_cdk_version() -> str:
+    return pkg_resources.get_distribution('aws-cdk.core').version
+
+
+def get_selected_stack(app: core.App) -> str:
+    return app.node.try_get_context('stack') or settings.CDK_STACK
+
+
+def get_synth_workers(app: core.App) -> int:
+    return int(app.node.try_get_context('workers') or settings.CDK_SYNTH_WORKERS)
+
+
+def get_synth_cache_dir(app: core.App) -> str:
+    return app.node.try_get_context('cache') or settings.CDK_SYNTH_CACHE
+
+
+def get_source_hash() -> str:
+    """Hash of every file in the `stacks` package, any code change invalidates the cache."""
+    digest = hashlib.sha256()
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for root, dir_names, file_names in os.walk(package_dir):
+        dir_names[:] = sorted(dir_name for dir_name in dir_names if dir_name != '__pycache__')
+        for file_name in sorted(file_names):
+            path = os.path.join(root, file_name)
+            digest.update(os.path.relpath(path, package_dir).encode())
+            with open(path, 'rb') as source:
+                digest.update(source.read())
+    return digest.hexdigest()
+
 
-def synth_stacks(app):
+def get_synth_context() -> dict:
+    """Context the CDK CLI passes to the app (cdk.json, cdk.context.json lookups, `-c` values)."""
+    context = json.loads(os.environ.get('CDK_CONTEXT_JSON') or '{}')
+    return {key: value for key, value in context.items() if key not in SYNTH_CONTEXT_KEYS}
+
+
+def get_cache_key(config: StackConfig, source_hash: str) -> str:
+    key = {
+        'config': vars(config),
+        'context': get_synth_context(),
+        'source': source_hash,
+        'cdk': get_cdk_version(),
+        'account': settings.AWS_ACCOUNT_ID,
+        'region': settings.AWS_DEFAULT_REGION,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def select_configs(configs: List[StackConfig], stack_name: str) -> List[StackConfig]:
+    if not stack_name:
+        return configs
+
+    # `<stack-name>-vpc` selects the VPC of the same config entry
+    if stack_name.endswith(VPC_STACK_SUFFIX):
+        stack_name = stack_name[:-len(VPC_STACK_SUFFIX)]
+
+    selected = [config for config in configs if config.stack_name == stack_name]
+    if not selected:
+        raise ValueError(f'Stack "{stack_name}" is not defined in cdk.stacks.json')
+    return selected
+
+
+def synth_stacks(app: core.App, configs: List[StackConfig] = None):
     aws_account = core.Environment(
         account=settings.AWS_ACCOUNT_ID,
         region=settings.AWS_DEFAULT_REGION,
     )
 
-    for config in StackConfig.get_configs():
+    if configs is None:
+        configs = select_configs(StackConfig.get_configs(), get_selected_stack(app))
+
+    for config in configs:
         vpc_stack = VPCStack(
             scope=app,
-            id=f'{config.stack_name}-vpc',
+            id=f'{config.stack_name}{VPC_STACK_SUFFIX}',
             vpc_name=config.stack_name,
+            config=config,
             env=aws_account,
         )
 
@@ -26,3 +110,124 @@ def synth_stacks(app):
             config=config,
             env=aws_account,
         )
+
+
+def synth_shard(outdir: str, stack_names: List[str]):
+    """Runs in a worker process, with its own App and jsii runtime."""
+    app = core.App(outdir=outdir)
+    configs = [config for config in StackConfig.get_configs() if config.stack_name in stack_names]
+    synth_stacks(app, configs)
+    app.synth()
+
+
+def get_shard_workers(entry_count: int, workers: int) -> int:
+    """Workers worth starting for `entry_count` config entries, 1 synthesizes in this process."""
+    return max(1, min(workers, entry_count // MIN_ENTRIES_PER_SYNTH_WORKER))
+
+
+def synth_shards(shard_dirs: List[str], shards: List[List[str]], workers: int):
+    workers = get_shard_workers(sum(len(shard) for shard in shards), workers)
+    if workers <= 1 or len(shards) <= 1:
+        for shard_dir, shard in zip(shard_dirs, shards):
+            synth_shard(shard_dir, shard)
+        return
+
+    # `spawn` keeps the parent jsii runtime out of the workers
+    mp_context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(shards)), mp_context=mp_context) as executor:
+        list(executor.map(synth_shard, shard_dirs, shards))
+
+
+def synth_stacks_parallel(outdir: str, workers: int):
+    stack_names = [config.stack_name for config in StackConfig.get_configs()]
+    workers = get_shard_workers(len(stack_names), workers)
+    if workers <= 1:
+        app = core.App(outdir=outdir)
+        synth_stacks(app)
+        app.synth()
+        return
+
+    shards = [stack_names[index::workers] for index in range(workers)]
+    shards = [shard for shard in shards if shard]
+
+    with tempfile.TemporaryDirectory() as shards_dir:
+        shard_dirs = [os.path.join(shards_dir, f'shard-{index}') for index in range(len(shards))]
+        synth_shards(shard_dirs, shards, workers)
+        merge_assemblies(outdir, shard_dirs)
+
+
+def synth_stacks_cached(outdir: str, cache_dir: str, workers: int = 1, stack_name: str = None) -> List[str]:
+    """
+    Every config entry (VPC and platform stack) is a cloud assembly in `cache_dir`, keyed by the
+    hash of the config, the CDK context, the `stacks` source and the CDK version. Only the entries without a cached
+    assembly are synthesized, then all of them are merged in `outdir`. Returns the synthesized stacks.
+    """
+    configs = select_configs(StackConfig.get_configs(), stack_name)
+    source_hash = get_source_hash()
+    entry_dirs = {
+        config.stack_name: os.path.join(cache_dir, get_cache_key(config, source_hash))
+        for config in configs
+    }
+    changed = [
+        name for name, entry_dir in entry_dirs.items()
+        if not os.path.exists(os.path.join(entry_dir, MANIFEST_FILE))
+    ]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # same filesystem as the cache, the entries are moved in place once complete
+    with tempfile.TemporaryDirectory(dir=cache_dir) as build_dir:
+        shard_dirs = [os.path.join(build_dir, name) for name in changed]
+        synth_shards(shard_dirs, [[name] for name in changed], workers)
+
+        for name, shard_dir in zip(changed, shard_dirs):
+            with open(os.path.join(shard_dir, MANIFEST_FILE)) as manifest_file:
+                missing_context = json.load(manifest_file).get('missing')
+            if missing_context:
+                # pending context lookups, the next synth has other values
+                entry_dirs[name] = shard_dir
+            elif not os.path.exists(entry_dirs[name]):
+                os.replace(shard_dir, entry_dirs[name])
+
+        merge_assemblies(outdir, [entry_dirs[config.stack_name] for config in configs])
+    return changed
+
+
+def merge_assemblies(outdir: str, assembly_dirs: List[str]):
+    """Merges several cloud assemblies into a single manifest in `outdir`."""
+    os.makedirs(outdir, exist_ok=True)
+    manifest = {'artifacts': {}, 'missing': []}
+
+    for assembly_dir in assembly_dirs:
+        with open(os.path.join(assembly_dir, MANIFEST_FILE)) as manifest_file:
+            assembly_manifest = json.load(manifest_file)
+
+        manifest['version'] = assembly_manifest['version']
+        for artifact_id, artifact in assembly_manifest.get('artifacts', {}).items():
+            # every shard has its own construct tree, none of them is complete
+            if artifact['type'] == TREE_ARTIFACT_TYPE:
+                continue
+            manifest['artifacts'][artifact_id] = artifact
+
+        for missing in assembly_manifest.get('missing', []):
+            if missing not in manifest['missing']:
+                manifest['missing'].append(missing)
+
+        for file_name in os.listdir(assembly_dir):
+            if file_name in (MANIFEST_FILE, 'tree.json'):
+                continue
+            copy_path(os.path.join(assembly_dir, file_name), os.path.join(outdir, file_name))
+
+    if not manifest['missing']:
+        del manifest['missing']
+
+    with open(os.path.join(outdir, MANIFEST_FILE), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+
+def copy_path(source: str, destination: str):
+    if os.path.isdir(source):
+        # assets are content addressed, an existing directory is the same asset
+        if not os.path.exists(destination):
+            shutil.copytree(source, destination)
+    else:
+        shutil.copy2(source, destination)
@@ -0,0 +1,35 @@
+import json
+import os
+
+# `stacks.settings` reads them on import
+os.environ.setdefault('AWS_ACCOUNT_ID', '123456789012')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import pytest  # noqa: E402
+from aws_cdk import core  # noqa: E402
+
+from benchmarks.synth_benchmark import BASE_CONFIG as BENCHMARK_CONFIG  # noqa: E402
+from stacks.settings import StackConfig  # noqa: E402
+from stacks.synth import synth_stacks  # noqa: E402
+
+# the generated configs of the synth benchmark, named after the test stack
+BASE_CONFIG = {**BENCHMARK_CONFIG, 'stack_name': 'test', 'dns_stack_subdomain': 'test'}
+
+
+@pytest.fixture
+def make_config():
+    def make(**options) -> StackConfig:
+        return StackConfig(**{**BASE_CONFIG, **options})
+    return make
+
+
+@pytest.fixture
+def synth():
+    """Template of the platform stack of a config."""
+    def synth_template(config: StackConfig) -> dict:
+        app = core.App()
+        synth_stacks(app, [config])
+        assembly = app.synth()
+        with open(os.path.join(assembly.directory, f'{config.stack_name}.template.json')) as template_file:
+            return json.load(template_file)
+    return synth_template
@@ -0,0 +1,70 @@
+import pytest
+
+from stacks.resources.ecs_services import (
+    get_capacity_provider_strategy,
+    get_log_router_config,
+    lua_quote,
+    validate_task_size,
+)
+
+
+@pytest.mark.parametrize('cpu, memory, ephemeral_storage', [
+    (256, 512, None),
+    (1024, 8192, None),
+    (4096, 30720, 200),
+    (512, 1024, 21),
+])
+def test_validate_task_size(cpu, memory, ephemeral_storage):
+    validate_task_size(cpu, memory, ephemeral_storage)
+
+
+@pytest.mark.parametrize('cpu, memory, ephemeral_storage, message', [
+    (300, 512, None, 'Invalid Fargate CPU'),
+    (256, 4096, None, 'Invalid Fargate memory'),
+    (512, 1024, 20, 'Invalid Fargate ephemeral storage'),
+    (512, 1024, 201, 'Invalid Fargate ephemeral storage'),
+])
+def test_validate_task_size_invalid(cpu, memory, ephemeral_storage, message):
+    with pytest.raises(ValueError, match=message):
+        validate_task_size(cpu, memory, ephemeral_storage)
+
+
+def test_lua_quote():
+    assert lua_quote('GET /health') == '"GET /health"'
+    assert lua_quote('say "hi" \\o/') == '"say \\"hi\\" \\\\o/"'
+    assert lua_quote('a\nb\u00e9') == '"a\\010b\\195\\169"'
+
+
+def test_log_router_config(make_config):
+    config = make_config(log_flush_seconds=2)
+
+    assert get_log_router_config(config) == '[SERVICE]\n    Flush 2\n    Grace 30\n'
+
+
+def test_log_router_config_filters(make_config):
+    config = make_config(log_exclude_pattern='^DEBUG', log_sample_pattern='GET "/health', log_sample_rate=20)
+
+    router_config = get_log_router_config(config)
+
+    assert '[FILTER]\n    Name grep\n    Match *\n    Exclude log ^DEBUG\n' in router_config
+    assert '    Name lua\n    Match *\n    call sample\n' in router_config
+    assert 'string.find(record["log"], "GET \\"/health", 1, true)' in router_config
+    assert '% 20' in router_config
+
+
+@pytest.mark.parametrize('rate', [0, -1, 2.5, '10', True])
+def test_log_router_config_invalid_sample_rate(make_config, rate):
+    config = make_config(log_sample_pattern='GET /health', log_sample_rate=rate)
+
+    with pytest.raises(ValueError, match='log_sample_rate'):
+        get_log_router_config(config)
+
+
+def test_get_capacity_provider_strategy():
+    assert get_capacity_provider_strategy(on_demand_base=1, on_demand_weight=1, spot_weight=0) is None
+
+    strategy = get_capacity_provider_strategy(on_demand_base=1, on_demand_weight=1, spot_weight=4)
+    assert [(item.capacity_provider, item.base, item.weight) for item in strategy] == [
+        ('FARGATE', 1, 1),
+        ('FARGATE_SPOT', None, 4),
+    ]
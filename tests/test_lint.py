@@ -0,0 +1,130 @@
+import pytest
+from aws_cdk import (
+    aws_applicationautoscaling as appscaling,
+    aws_ec2 as ec2,
+    aws_ecr as ecr,
+    aws_elasticache as elasticache,
+    core,
+)
+
+from stacks.lint import PerformanceRules, add_lint_rules, suppress_rule
+
+
+def create_redis(scope: core.Construct, id: str = 'redis') -> elasticache.CfnCacheCluster:
+    return elasticache.CfnCacheCluster(scope, id, engine='redis', cache_node_type='cache.t3.micro', num_cache_nodes=1)
+
+
+def get_messages(app: core.App, stack: core.Stack) -> list:
+    assembly = app.synth()
+    return [
+        (message.entry.type, message.id, message.entry.data)
+        for message in assembly.get_stack_by_name(stack.stack_name).messages
+    ]
+
+
+@pytest.fixture
+def app():
+    return core.App()
+
+
+@pytest.fixture
+def stack(app):
+    return core.Stack(app, 'test')
+
+
+def test_lint_warning(app, stack, make_config):
+    create_redis(stack)
+    add_lint_rules(stack, make_config())
+
+    assert get_messages(app, stack) == [(
+        'aws:cdk:warning', '/test/redis',
+        '[redis-no-replicas] Redis single node cluster, no replica takes the reads or the failover',
+    )]
+
+
+def test_lint_strict(app, stack, make_config):
+    create_redis(stack)
+    add_lint_rules(stack, make_config(lint_strict=True))
+
+    [(message_type, _, data)] = get_messages(app, stack)
+    assert (message_type, data.split()[0]) == ('aws:cdk:error', '[redis-no-replicas]')
+
+
+def test_lint_strict_context(make_config):
+    app = core.App(context={'lint_strict': 'true'})
+    stack = core.Stack(app, 'test')
+    create_redis(stack)
+    add_lint_rules(stack, make_config())
+
+    assert get_messages(app, stack)[0][0] == 'aws:cdk:error'
+
+
+@pytest.mark.parametrize('options', [
+    {'lint_rules': {'redis-no-replicas': 'off'}},
+    {'lint_suppressions': {'redis-no-replicas': 'staging cache'}},
+])
+def test_lint_rule_off(app, stack, make_config, options):
+    create_redis(stack)
+    add_lint_rules(stack, make_config(**options))
+
+    assert get_messages(app, stack) == []
+
+
+def test_suppress_rule(app, stack, make_config):
+    scope = core.Construct(stack, 'cache')
+    create_redis(scope)
+    create_redis(stack, 'other')
+    suppress_rule(scope, 'redis-no-replicas', 'staging cache')
+    add_lint_rules(stack, make_config())
+
+    assert [message_id for _, message_id, _ in get_messages(app, stack)] == ['/test/other']
+
+
+def test_suppress_unknown_rule(stack):
+    with pytest.raises(ValueError, match='Unknown lint rule'):
+        suppress_rule(stack, 'redis', 'typo')
+
+
+@pytest.mark.parametrize('options, message', [
+    ({'lint_rules': {'redis': 'off'}}, 'Unknown lint rule redis'),
+    ({'lint_rules': {'redis-no-replicas': 'info'}}, 'Invalid level info'),
+])
+def test_lint_rules_invalid(make_config, options, message):
+    with pytest.raises(ValueError, match=message):
+        PerformanceRules(make_config(**options))
+
+
+def test_lint_scaling(app, stack, make_config):
+    target = appscaling.ScalableTarget(
+        stack, 'scaling',
+        service_namespace=appscaling.ServiceNamespace.ECS,
+        resource_id='service/cluster/service',
+        scalable_dimension='ecs:service:DesiredCount',
+        min_capacity=1,
+        max_capacity=4,
+    )
+    target.scale_to_track_metric(
+        'cpu',
+        target_value=50,
+        predefined_metric=appscaling.PredefinedMetric.ECS_SERVICE_AVERAGE_CPU_UTILIZATION,
+    )
+    add_lint_rules(stack, make_config())
+
+    assert [data.split()[0] for _, _, data in get_messages(app, stack)] == ['[scaling-cpu-only]', '[scaling-capped]']
+
+
+def test_lint_ecr_expiry(app, stack, make_config):
+    ecr.Repository(stack, 'repository', lifecycle_rules=[ecr.LifecycleRule(max_image_age=core.Duration.days(30))])
+    ecr.Repository(stack, 'counted', lifecycle_rules=[ecr.LifecycleRule(max_image_count=10)])
+    add_lint_rules(stack, make_config())
+
+    [(_, message_id, data)] = get_messages(app, stack)
+    assert (message_id, data.split()[0]) == ('/test/repository/Resource', '[ecr-image-expiry]')
+
+
+@pytest.mark.parametrize('nat_gateways, messages', [(1, 1), (2, 0)])
+def test_lint_vpc_nat(app, stack, make_config, nat_gateways, messages):
+    ec2.Vpc(stack, 'vpc', max_azs=2, nat_gateways=nat_gateways)
+    add_lint_rules(stack, make_config())
+
+    assert [data.split()[0] for _, _, data in get_messages(app, stack)] == ['[vpc-single-nat]'] * messages
@@ -0,0 +1,61 @@
+import json
+import os
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from loadtest import runner, stub_server
+
+
+@pytest.fixture
+def master_url():
+    stub_server.LocustMasterHandler.workers = 2
+    server = ThreadingHTTPServer(('127.0.0.1', 0), stub_server.LocustMasterHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_runner(master_url, tmp_path):
+    runner.main([
+        '--master', master_url, '--host', 'https://api.example.com', '--users', '10', '--duration', '1',
+        '--workers', '2', '--results-dir', str(tmp_path),
+    ])
+
+    [results_dir] = tmp_path.iterdir()
+    assert sorted(os.listdir(results_dir)) == ['failures.csv', 'requests.csv', 'summary.json']
+    with open(results_dir / 'summary.json') as summary_file:
+        summary = json.load(summary_file)
+    assert summary['host'] == 'https://api.example.com'
+    assert (summary['users'], summary['user_count'], summary['worker_count']) == (10, 10, 2)
+    assert summary['num_requests'] > 0
+    assert set(summary['response_time_percentiles']) == {'p0.5', 'p0.95'}
+    assert stub_server.state['state'] == 'stopped'
+
+
+def test_runner_missing_workers(master_url, tmp_path, monkeypatch):
+    monkeypatch.setattr(runner, 'POLL_SECONDS', 0.1)
+
+    with pytest.raises(TimeoutError, match='Less than 3 Locust workers'):
+        runner.main([
+            '--master', master_url, '--host', 'https://api.example.com', '--workers', '3', '--timeout', '0',
+            '--results-dir', str(tmp_path),
+        ])
+    assert not list(tmp_path.iterdir())
+
+
+def test_summarize():
+    stats = {
+        'user_count': 5,
+        'stats': [{'name': '/health', 'num_requests': 1}, {'name': 'Aggregated', 'num_requests': 3}],
+        'response_time_percentile_0.99': 120,
+    }
+
+    summary = runner.summarize(stats)
+
+    assert summary['num_requests'] == 3
+    assert summary['response_time_percentiles'] == {'p0.99': 120}
+    assert summary['errors'] == []
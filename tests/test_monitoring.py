@@ -0,0 +1,88 @@
+import pytest
+from aws_cdk import aws_cloudwatch as cloudwatch, aws_elasticache as elasticache, core
+
+from stacks.resources.monitoring import get_cache_metric, get_cache_node_ids
+
+ALARM_TOPIC_ARN = 'arn:aws:sns:us-east-1:123456789012:alarms'
+
+
+def get_alarms(template: dict) -> dict:
+    return {
+        resource['Properties']['AlarmName']: resource['Properties']
+        for resource in template['Resources'].values()
+        if resource['Type'] == 'AWS::CloudWatch::Alarm' and 'AlarmName' in resource['Properties']
+    }
+
+
+@pytest.fixture
+def stack():
+    return core.Stack(core.App(), 'test')
+
+
+def test_alarms(make_config, synth):
+    template = synth(make_config(
+        monitoring_enabled=True,
+        alarm_topic_arn=ALARM_TOPIC_ARN,
+        alarm_cache_hit_ratio=80,
+        cache_roles={'cache': {}, 'broker': {}},
+        worker_queue_scaling=True,
+    ))
+
+    alarms = get_alarms(template)
+    assert sorted(alarms) == sorted(f'test-{name}' for name in [
+        'latencyAlarm', 'errorsAlarm', 'appCpuAlarm', 'appMemoryAlarm', 'workerCpuAlarm', 'workerMemoryAlarm',
+        'databaseCpuAlarm', 'databaseConnectionsAlarm', 'databaseReadLatencyAlarm', 'databaseWriteLatencyAlarm',
+        'cacheCacheCpuAlarm', 'cacheCacheEvictionsAlarm', 'cacheCacheHitRatioAlarm',
+        'brokerCacheCpuAlarm', 'brokerCacheEvictionsAlarm', 'workerQueueAlarm',
+    ])
+    # 80% of the 112 connections of a t3.micro
+    assert alarms['test-databaseConnectionsAlarm']['Threshold'] == 89
+    assert alarms['test-cacheCacheHitRatioAlarm']['ComparisonOperator'] == 'LessThanThreshold'
+    assert all(alarm['AlarmActions'] == [ALARM_TOPIC_ARN] for alarm in alarms.values())
+    assert 'AWS::CloudWatch::Dashboard' in {resource['Type'] for resource in template['Resources'].values()}
+
+
+def test_alarms_without_thresholds(make_config, synth):
+    template = synth(make_config(monitoring_enabled=True, alarm_latency_p99=None, alarm_database_connections=None))
+
+    alarms = get_alarms(template)
+    assert 'test-latencyAlarm' not in alarms
+    assert 'test-databaseConnectionsAlarm' not in alarms
+    assert 'test-cacheCpuAlarm' in alarms
+    assert not any('HitRatio' in name for name in alarms)
+    assert not any('AlarmActions' in alarm for alarm in alarms.values())
+
+
+def test_get_cache_node_ids(stack):
+    cluster = elasticache.CfnCacheCluster(
+        stack, 'cluster', engine='redis', cache_node_type='cache.t3.micro', num_cache_nodes=1,
+    )
+    group = elasticache.CfnReplicationGroup(
+        stack, 'group', replication_group_description='group', num_cache_clusters=2,
+    )
+    sharded = elasticache.CfnReplicationGroup(
+        stack, 'sharded', replication_group_description='sharded', num_node_groups=2, replicas_per_node_group=1,
+    )
+
+    assert stack.resolve(get_cache_node_ids(cluster)) == [{'Ref': 'cluster'}]
+    assert [node_id.split('-', 1)[1] for node_id in get_cache_node_ids(group)] == ['001', '002']
+    assert [node_id.split('-', 1)[1] for node_id in get_cache_node_ids(sharded)] == [
+        '0001-001', '0001-002', '0002-001', '0002-002',
+    ]
+
+
+def test_get_cache_metric(stack):
+    cluster = elasticache.CfnCacheCluster(
+        stack, 'cluster', engine='redis', cache_node_type='cache.t3.micro', num_cache_nodes=1,
+    )
+    group = elasticache.CfnReplicationGroup(
+        stack, 'group', replication_group_description='group', num_cache_clusters=2,
+    )
+
+    metric = get_cache_metric(cluster, 'Evictions', 'Sum', 'evictions', expression='SUM')
+    assert isinstance(metric, cloudwatch.Metric)
+    assert metric.label == 'evictions'
+
+    expression = get_cache_metric(group, 'Evictions', 'Sum', 'evictions', expression='SUM')
+    assert isinstance(expression, cloudwatch.MathExpression)
+    assert expression.expression == 'SUM([evictions0, evictions1])'
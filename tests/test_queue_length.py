@@ -0,0 +1,114 @@
+import importlib.util
+import socket
+import socketserver
+import sys
+import threading
+import types
+
+import pytest
+
+from stacks.resources.monitoring import FUNCTIONS_DIR
+
+QUEUES = {'celery': 3, 'reports': 12}
+
+
+class RedisHandler(socketserver.StreamRequestHandler):
+    """LLEN of `QUEUES`, or the redirect of a cluster mode node with `moved`."""
+    moved = False
+
+    def handle(self):
+        while True:
+            header = self.rfile.readline()
+            if not header:
+                return
+            args = []
+            for _ in range(int(header[1:])):
+                self.rfile.readline()  # $<length>
+                args.append(self.rfile.readline().strip().decode())
+            if self.moved:
+                self.wfile.write(b'-MOVED 3300 10.0.0.1:6379\r\n')
+            else:
+                self.wfile.write(f':{QUEUES.get(args[1], 0)}\r\n'.encode())
+
+
+@pytest.fixture
+def redis_address():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), RedisHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def function(monkeypatch, redis_address):
+    # boto3 comes with the Lambda runtime, the metrics are recorded instead
+    metric_data = []
+    client = types.SimpleNamespace(put_metric_data=lambda **kwargs: metric_data.append(kwargs))
+    monkeypatch.setitem(sys.modules, 'boto3', types.SimpleNamespace(client=lambda service: client))
+    spec = importlib.util.spec_from_file_location('queue_length', f'{FUNCTIONS_DIR}/queue_length.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    monkeypatch.setenv('QUEUE_POOLS', '{"worker": ["celery"], "reports": ["reports", "pdf"]}')
+    monkeypatch.setenv('REDIS_HOST', redis_address[0])
+    monkeypatch.setenv('REDIS_PORT', str(redis_address[1]))
+    monkeypatch.setenv('METRIC_NAMESPACE', 'Celery')
+    monkeypatch.setenv('METRIC_NAME', 'QueueLength')
+    monkeypatch.setenv('STACK_NAME', 'test')
+    module.metric_data = metric_data
+    return module
+
+
+def test_encode_command(function):
+    assert function.encode_command('LLEN', 'celery') == b'*2\r\n$4\r\nLLEN\r\n$6\r\ncelery\r\n'
+    # bulk string lengths in bytes
+    assert function.encode_command('LLEN', 'cola-é').endswith('$7\r\ncola-é\r\n'.encode())
+
+
+def test_handler(function):
+    assert function.handler({}, None) == {'worker': 3, 'reports': 12}
+
+    [call] = function.metric_data
+    assert call['Namespace'] == 'Celery'
+    assert [(data['MetricName'], data['Dimensions'][1]['Value'], data['Value']) for data in call['MetricData']] == [
+        ('QueueLength', 'worker', 3),
+        ('QueueLength', 'reports', 12),
+    ]
+    assert call['MetricData'][0]['Dimensions'][0] == {'Name': 'StackName', 'Value': 'test'}
+
+
+def test_handler_cluster_mode(function, monkeypatch):
+    monkeypatch.setattr(RedisHandler, 'moved', True)
+
+    with pytest.raises(ValueError, match='MOVED'):
+        function.handler({}, None)
+    assert function.metric_data == []
+
+
+def test_queue_length_closed_connection(function):
+    first, second = socket.socketpair()
+    second.close()
+
+    with first, pytest.raises((ConnectionError, OSError)):
+        function.queue_length(first, 'celery')
+
+
+def get_resources(template: dict, prefix: str) -> dict:
+    return {
+        key[len(prefix):-8]: resource['Properties']
+        for key, resource in template['Resources'].items() if key.startswith(prefix)
+    }
+
+
+@pytest.mark.parametrize('scale_to_zero, threshold', [(False, 100), (True, 1)])
+def test_queue_scaling(make_config, synth, scale_to_zero, threshold):
+    template = synth(make_config(worker_queue_scaling=True, worker_scale_to_zero=scale_to_zero))
+
+    resources = get_resources(template, 'serviceworkerTaskCountTarget')
+    assert resources['']['MinCapacity'] == (0 if scale_to_zero else 1)
+    assert resources['QueueScalingUpperAlarm']['Threshold'] == threshold
+    # scale in after 10 minutes of empty queue, every 5 minutes
+    assert resources['QueueScalingLowerAlarm']['EvaluationPeriods'] == 10
+    assert resources['QueueScalingLowerPolicy']['StepScalingPolicyConfiguration']['Cooldown'] == 300
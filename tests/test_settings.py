@@ -0,0 +1,68 @@
+import pytest
+
+
+def test_default_worker_pool(make_config):
+    config = make_config(worker_queues=['celery'], worker_cpu=1024, worker_memory=2048, desired_worker_count=2)
+
+    [pool] = config.get_worker_pools()
+
+    assert pool.name == 'worker'
+    assert pool.queues == ['celery']
+    assert (pool.cpu, pool.memory, pool.desired_count) == (1024, 2048, 2)
+
+
+def test_worker_pools(make_config):
+    config = make_config(worker_pools=[
+        {'name': 'worker', 'queues': ['celery']},
+        {'name': 'reports', 'queues': ['reports'], 'concurrency': 2, 'memory': 4096},
+    ])
+
+    pools = config.get_worker_pools()
+
+    assert [pool.name for pool in pools] == ['worker', 'reports']
+    assert (pools[1].concurrency, pools[1].memory) == (2, 4096)
+
+
+@pytest.mark.parametrize('name', ['Reports', '1reports', 'reports_pdf', ''])
+def test_worker_pool_invalid_name(make_config, name):
+    config = make_config(worker_pools=[{'name': name}])
+
+    with pytest.raises(ValueError, match='Invalid worker pool name'):
+        config.get_worker_pools()
+
+
+@pytest.mark.parametrize('name', ['app', 'release', 'locust-master', 'locust-worker'])
+def test_worker_pool_reserved_name(make_config, name):
+    config = make_config(worker_pools=[{'name': name}])
+
+    with pytest.raises(ValueError, match='Reserved worker pool name'):
+        config.get_worker_pools()
+
+
+def test_worker_pool_duplicated_name(make_config):
+    config = make_config(worker_pools=[{'name': 'reports'}, {'name': 'reports'}])
+
+    with pytest.raises(ValueError, match='Duplicated worker pool names'):
+        config.get_worker_pools()
+
+
+def test_worker_pool_unknown_keys(make_config):
+    config = make_config(worker_pools=[{'name': 'reports', 'queue': ['reports'], 'replicas': 2}])
+
+    with pytest.raises(ValueError, match='Unknown keys queue, replicas of worker pool reports of test'):
+        config.get_worker_pools()
+
+
+def test_worker_pool_scale_to_zero_needs_queue_scaling(make_config):
+    pools = [{'name': 'reports', 'scale_to_zero': True}]
+
+    with pytest.raises(ValueError, match='needs worker_queue_scaling'):
+        make_config(worker_pools=pools).get_worker_pools()
+    assert make_config(worker_pools=pools, worker_queue_scaling=True).get_worker_pools()[0].scale_to_zero
+
+
+def test_worker_queue_scaling_cache_cluster_mode(make_config):
+    config = make_config(worker_queue_scaling=True, cache_cluster_mode=True)
+
+    with pytest.raises(ValueError, match='without cache_cluster_mode'):
+        config.get_worker_pools()
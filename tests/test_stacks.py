@@ -0,0 +1,94 @@
+"""Synth smoke tests of a minimal and of a full-featured stack."""
+import json
+
+import pytest
+
+FULL_OPTIONS = {
+    'app_cpu': 1024,
+    'app_memory': 2048,
+    'app_spot_weight': 1,
+    'app_scaling_schedules': [{'name': 'night', 'schedule': 'cron(0 22 * * ? *)', 'min_count': 1}],
+    'worker_queue_scaling': True,
+    'worker_pools': [
+        {'name': 'worker', 'queues': ['celery']},
+        {'name': 'reports', 'queues': ['reports'], 'memory': 4096, 'scale_to_zero': True},
+    ],
+    'cache_roles': {'cache': {}, 'broker': {}},
+    'cache_replication': True,
+    'database_engine': 'aurora-postgresql',
+    'database_proxy': True,
+    'database_read_replicas': 1,
+    'cdn_enabled': True,
+    'cdn_certificate_arn': 'arn:aws:acm:us-east-1:123456789012:certificate/00000000-0000-0000-0000-000000000000',
+    'vpc_endpoints': ['s3', 'ecr', 'logs'],
+    'datadog_sockets': True,
+    'monitoring_enabled': True,
+    'log_router': 'cloudwatch',
+    'log_sample_pattern': 'GET /health',
+    'release_command': ['/release'],
+    'service_connect': True,
+    'load_test_enabled': True,
+}
+
+
+def get_resource_types(template: dict) -> set:
+    return {resource['Type'] for resource in template['Resources'].values()}
+
+
+@pytest.mark.parametrize('options', [{}, FULL_OPTIONS], ids=['minimal', 'full'])
+def test_synth(make_config, synth, options):
+    template = synth(make_config(**options))
+
+    resource_types = get_resource_types(template)
+    assert {'AWS::ECS::Cluster', 'AWS::ECS::Service', 'AWS::CodePipeline::Pipeline'} <= resource_types
+    if options:
+        assert {
+            'AWS::RDS::DBCluster', 'AWS::RDS::DBProxyEndpoint', 'AWS::CloudFront::Distribution',
+            'AWS::ElastiCache::ReplicationGroup', 'AWS::ServiceDiscovery::PrivateDnsNamespace',
+        } <= resource_types
+    else:
+        assert 'AWS::RDS::DBInstance' in resource_types
+
+
+def test_synth_load_test(make_config, synth):
+    template = synth(make_config(load_test_enabled=True, load_test_workers=3))
+
+    services = [
+        resource['Properties'] for resource in template['Resources'].values()
+        if resource['Type'] == 'AWS::ECS::Service' and 'locust' in json.dumps(resource['Properties'])
+    ]
+    assert [service['DesiredCount'] for service in services] == [0, 0]
+    containers = {
+        container['Name']: container
+        for resource in template['Resources'].values() if resource['Type'] == 'AWS::ECS::TaskDefinition'
+        for container in resource['Properties']['ContainerDefinitions']
+    }
+    assert '--desired-count 3' in json.dumps(containers['scale-up']['Command'])
+    assert {'ContainerName': 'runner', 'Condition': 'COMPLETE'} in containers['results']['DependsOn']
+
+
+def test_synth_load_test_invalid_size(make_config, synth):
+    with pytest.raises(ValueError, match='Invalid Fargate memory'):
+        synth(make_config(load_test_enabled=True, load_test_cpu=1024, load_test_memory=1024))
+
+
+def test_synth_capacity_provider_strategy(make_config, synth):
+    template = synth(make_config(app_spot_weight=3, app_on_demand_base=2))
+
+    clusters = [
+        resource['Properties'] for resource in template['Resources'].values()
+        if resource['Type'] == 'AWS::ECS::Cluster'
+    ]
+    assert clusters[0]['CapacityProviders'] == ['FARGATE', 'FARGATE_SPOT']
+    services = [
+        resource['Properties'] for resource in template['Resources'].values()
+        if resource['Type'] == 'AWS::ECS::Service'
+    ]
+    spot_services = [service for service in services if 'CapacityProviderStrategy' in service]
+    assert [service['CapacityProviderStrategy'] for service in spot_services] == [[
+        {'CapacityProvider': 'FARGATE', 'Base': 2, 'Weight': 1},
+        {'CapacityProvider': 'FARGATE_SPOT', 'Weight': 3},
+    ]]
+    # the strategy replaces the launch type, the worker stays on demand
+    assert 'LaunchType' not in spot_services[0]
+    assert all(service['LaunchType'] == 'FARGATE' for service in services if service not in spot_services)
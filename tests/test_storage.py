@@ -0,0 +1,80 @@
+import pytest
+from aws_cdk import aws_rds as rds, core
+
+from stacks.resources.storage import (
+    create_rds_parameter_group,
+    get_instance_memory_mib,
+    get_postgres_parameters,
+    get_rds_storage_props,
+)
+
+
+@pytest.mark.parametrize('instance_class, memory_mib', [
+    ('t3.micro', 1024),
+    ('db.t4g.medium', 4096),
+    ('m5.large', 8192),
+    ('r5.2xlarge', 65536),
+    ('r4.large', 15616),
+    ('m5.metal', None),
+    ('z1d.large', None),
+])
+def test_get_instance_memory_mib(instance_class, memory_mib):
+    assert get_instance_memory_mib(instance_class) == memory_mib
+
+
+def test_get_postgres_parameters():
+    parameters = get_postgres_parameters(8192)
+
+    # RDS default of 8 GiB
+    assert parameters['max_connections'] == '901'
+    assert parameters['shared_buffers'] == str(8192 * 1024 // 4 // 8)
+    assert parameters['effective_cache_size'] == str(8192 * 1024 * 3 // 4 // 8)
+    assert parameters['maintenance_work_mem'] == str(8192 * 1024 // 16)
+    assert parameters['work_mem'] == '4096'
+
+
+def test_get_postgres_parameters_limits():
+    parameters = get_postgres_parameters(262144, max_connections=100)
+
+    assert parameters['max_connections'] == '100'
+    assert parameters['work_mem'] == str(262144 * 1024 * 3 // 4 // 300)
+    assert parameters['maintenance_work_mem'] == str(2 * 1024 * 1024)
+    assert get_postgres_parameters(1048576)['max_connections'] == '5000'
+
+
+def test_get_rds_storage_props(make_config):
+    assert get_rds_storage_props('test', make_config()) == {}
+    assert get_rds_storage_props('test', make_config(database_max_allocated_storage=100)) == {
+        'max_allocated_storage': 100,
+    }
+    assert get_rds_storage_props('test', make_config(database_storage_type='io1', database_iops=3000))['iops'] == 3000
+
+
+@pytest.mark.parametrize('options, message', [
+    ({'database_max_allocated_storage': 25}, 'must exceed the allocated storage'),
+    ({'database_storage_type': 'io1'}, 'needs database_iops'),
+    ({'database_storage_type': 'gp3', 'database_iops': 12000}, 'need at least 400 GiB'),
+    ({'database_storage_type': 'standard'}, 'Invalid database_storage_type'),
+])
+def test_get_rds_storage_props_invalid(make_config, options, message):
+    with pytest.raises(ValueError, match=message):
+        get_rds_storage_props('test', make_config(**options))
+
+
+def test_create_rds_parameter_group(make_config):
+    engine = rds.DatabaseInstanceEngine.postgres(version=rds.PostgresEngineVersion.VER_11)
+    stack = core.Stack(core.App(), 'test')
+
+    assert create_rds_parameter_group(stack, 'test', make_config(), engine) is None
+    config = make_config(database_tuned_parameters=True, database_size='m5.large')
+    assert create_rds_parameter_group(stack, 'test', config, engine) is not None
+
+    config = make_config(database_tuned_parameters=True, database_size='z1d.large')
+    with pytest.raises(ValueError, match='needs a known instance class, z1d.large is not'):
+        create_rds_parameter_group(stack, 'test', config, engine)
+
+
+def test_tuned_parameters_aurora(make_config, synth):
+    config = make_config(database_tuned_parameters=True, database_engine='aurora-postgresql')
+    with pytest.raises(ValueError, match='only supported by the postgres engine'):
+        synth(config)
@@ -0,0 +1,191 @@
+import json
+import os
+
+import pytest
+
+from stacks import synth
+from stacks.synth import (
+    MANIFEST_FILE,
+    get_cache_key,
+    get_shard_workers,
+    merge_assemblies,
+    select_configs,
+    synth_stacks_cached,
+    synth_stacks_parallel,
+)
+from tests.conftest import BASE_CONFIG
+
+
+def write_assembly(assembly_dir: str, artifacts: dict, missing: list = None, files: dict = None):
+    os.makedirs(assembly_dir)
+    manifest = {'version': '5.0.0', 'artifacts': artifacts}
+    if missing:
+        manifest['missing'] = missing
+    with open(os.path.join(assembly_dir, MANIFEST_FILE), 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    for file_name, content in (files or {}).items():
+        with open(os.path.join(assembly_dir, file_name), 'w') as file:
+            file.write(content)
+
+
+@pytest.fixture
+def stacks_file(tmp_path, monkeypatch):
+    """Writes a `cdk.stacks.json` with the given stack names in a working directory."""
+    def write(*stack_names: str):
+        configs = [
+            {**BASE_CONFIG, 'stack_name': name, 'dns_stack_subdomain': name} for name in stack_names
+        ]
+        with open(tmp_path / 'cdk.stacks.json', 'w') as config_file:
+            json.dump(configs, config_file)
+        monkeypatch.chdir(tmp_path)
+    return write
+
+
+def read_artifacts(assembly_dir: str) -> list:
+    with open(os.path.join(assembly_dir, MANIFEST_FILE)) as manifest_file:
+        return sorted(json.load(manifest_file)['artifacts'])
+
+
+def test_get_cache_key(make_config, monkeypatch):
+    monkeypatch.delenv('CDK_CONTEXT_JSON', raising=False)
+    key = get_cache_key(make_config(), 'source')
+
+    assert key == get_cache_key(make_config(), 'source')
+    assert key != get_cache_key(make_config(app_cpu=1024), 'source')
+    assert key != get_cache_key(make_config(), 'changed source')
+
+
+def test_get_cache_key_context(make_config, monkeypatch):
+    monkeypatch.setenv('CDK_CONTEXT_JSON', json.dumps({'stack': 'test', 'workers': 4}))
+    key = get_cache_key(make_config(), 'source')
+
+    # the context values of this app don't change the templates
+    monkeypatch.setenv('CDK_CONTEXT_JSON', json.dumps({'stack': 'other'}))
+    assert get_cache_key(make_config(), 'source') == key
+
+    monkeypatch.setenv('CDK_CONTEXT_JSON', json.dumps({'availability-zones:account=1:region=us-east-1': ['a']}))
+    assert get_cache_key(make_config(), 'source') != key
+
+
+def test_select_configs(make_config):
+    configs = [make_config(stack_name='api-staging'), make_config(stack_name='api-prod')]
+
+    assert select_configs(configs, '') == configs
+    assert select_configs(configs, 'api-prod') == configs[1:]
+    assert select_configs(configs, 'api-prod-vpc') == configs[1:]
+
+
+def test_merge_assemblies(tmp_path):
+    first, second, outdir = str(tmp_path / 'first'), str(tmp_path / 'second'), str(tmp_path / 'out')
+    lookup = {'key': 'availability-zones', 'provider': 'availability-zones', 'props': {}}
+    write_assembly(
+        first,
+        {
+            'api-staging': {'type': 'aws:cloudformation:stack'},
+            'Tree': {'type': 'cdk:tree'},
+        },
+        missing=[lookup],
+        files={'api-staging.template.json': '{}', 'tree.json': '{}'},
+    )
+    write_assembly(
+        second,
+        {'api-prod': {'type': 'aws:cloudformation:stack'}, 'Tree': {'type': 'cdk:tree'}},
+        missing=[lookup],
+        files={'api-prod.template.json': '{}'},
+    )
+    os.makedirs(os.path.join(second, 'asset.1234'))
+
+    merge_assemblies(outdir, [first, second])
+
+    with open(os.path.join(outdir, MANIFEST_FILE)) as manifest_file:
+        manifest = json.load(manifest_file)
+    assert manifest == {
+        'version': '5.0.0',
+        'artifacts': {
+            'api-staging': {'type': 'aws:cloudformation:stack'},
+            'api-prod': {'type': 'aws:cloudformation:stack'},
+        },
+        'missing': [lookup],
+    }
+    assert sorted(os.listdir(outdir)) == [
+        'api-prod.template.json', 'api-staging.template.json', 'asset.1234', MANIFEST_FILE,
+    ]
+
+
+def test_merge_assemblies_without_missing(tmp_path):
+    assembly, outdir = str(tmp_path / 'assembly'), str(tmp_path / 'out')
+    write_assembly(assembly, {'api-prod': {'type': 'aws:cloudformation:stack'}})
+
+    merge_assemblies(outdir, [assembly])
+
+    with open(os.path.join(outdir, MANIFEST_FILE)) as manifest_file:
+        assert 'missing' not in json.load(manifest_file)
+
+
+def test_get_shard_workers():
+    assert get_shard_workers(3, 4) == 1
+    assert get_shard_workers(8, 4) == 2
+    assert get_shard_workers(40, 4) == 4
+    assert get_shard_workers(40, 1) == 1
+
+
+def test_synth_stacks_parallel(stacks_file, tmp_path, monkeypatch):
+    # one worker per entry, the pool path runs with 2 spawned workers
+    monkeypatch.setattr(synth, 'MIN_ENTRIES_PER_SYNTH_WORKER', 1)
+    stacks_file('one', 'two')
+    synth_stacks_parallel(str(tmp_path / 'out'), 2)
+
+    artifacts = read_artifacts(str(tmp_path / 'out'))
+    assert [name for name in artifacts if not name.startswith('Tree')] == ['one', 'one-vpc', 'two', 'two-vpc']
+    assert os.path.exists(tmp_path / 'out' / 'two.template.json')
+
+
+def test_synth_stacks_parallel_few_entries(stacks_file, tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('no worker is started for 2 entries')
+
+    monkeypatch.setattr(synth, 'ProcessPoolExecutor', fail)
+    stacks_file('one', 'two')
+    synth_stacks_parallel(str(tmp_path / 'out'), 4)
+
+    assert os.path.exists(tmp_path / 'out' / 'one.template.json')
+    assert os.path.exists(tmp_path / 'out' / 'two.template.json')
+
+
+def fake_synth_shards(synthesized: list, missing: list = None):
+    """Writes a stack manifest per shard instead of running the CDK app."""
+    def synth_shards(shard_dirs, shards, workers):
+        for shard_dir, shard in zip(shard_dirs, shards):
+            synthesized.extend(shard)
+            write_assembly(shard_dir, {shard[0]: {'type': 'aws:cloudformation:stack'}}, missing=missing)
+    return synth_shards
+
+
+def test_synth_stacks_cached(stacks_file, tmp_path, monkeypatch):
+    synthesized = []
+    monkeypatch.setattr(synth, 'synth_shards', fake_synth_shards(synthesized))
+    stacks_file('one', 'two')
+    cache_dir = str(tmp_path / 'cache')
+
+    assert synth_stacks_cached(str(tmp_path / 'out'), cache_dir) == ['one', 'two']
+    # the second synth reuses the cached entries
+    assert synth_stacks_cached(str(tmp_path / 'out-cached'), cache_dir) == []
+    assert synthesized == ['one', 'two']
+    assert read_artifacts(str(tmp_path / 'out-cached')) == ['one', 'two']
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_synth_stacks_cached_missing_context(stacks_file, tmp_path, monkeypatch):
+    synthesized = []
+    missing = [{'key': 'hosted-zone', 'provider': 'hosted-zone', 'props': {}}]
+    monkeypatch.setattr(synth, 'synth_shards', fake_synth_shards(synthesized, missing))
+    stacks_file('one')
+    cache_dir = str(tmp_path / 'cache')
+
+    assert synth_stacks_cached(str(tmp_path / 'out'), cache_dir) == ['one']
+    assert os.listdir(cache_dir) == []
+    with open(tmp_path / 'out' / MANIFEST_FILE) as manifest_file:
+        assert json.load(manifest_file)['missing'] == missing
+    # nothing was cached, the next synth runs again with the looked up values
+    assert synth_stacks_cached(str(tmp_path / 'out'), cache_dir) == ['one']
+    assert synthesized == ['one', 'one']
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from stacks.resources.workflow import BUILDX_VERSION, get_build_spec, get_release_build_spec
+
+BUILDX_FILE = f'buildx-{BUILDX_VERSION}.linux-amd64'
+# serves the release files of `downloads`, by name
+FAKE_CURL = '''#!/bin/sh
+for arg; do case "$arg" in http*) url="$arg";; esac; done
+file="$DOWNLOADS/$(basename "$url")"
+[ -f "$file" ] || exit 22
+if [ "$3" = "-o" ]; then cp "$file" "$4"; else cat "$file"; fi
+'''
+
+
+def get_commands(build_spec: dict, phase: str) -> list:
+    return build_spec['phases'][phase]['commands']
+
+
+def run_commands(commands: list, tmp_path, scripts: dict, **env) -> subprocess.CompletedProcess:
+    """Runs build spec commands as CodeBuild does, with fake executables (name: script) first in the PATH."""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir(exist_ok=True)
+    for name, script in scripts.items():
+        (bin_dir / name).write_text(script)
+        (bin_dir / name).chmod(0o755)
+    return subprocess.run(
+        ['sh', '-e', '-c', '\n'.join(commands)],
+        cwd=tmp_path,
+        env={**os.environ, 'PATH': f'{bin_dir}:{os.environ["PATH"]}', 'HOME': str(tmp_path), **env},
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_build_spec_local(make_config):
+    build_spec = get_build_spec(make_config())
+
+    assert 'env' not in build_spec
+    assert 'docker build -f Dockerfile.prod -t ${IMAGE_LATEST} .' in get_commands(build_spec, 'build')
+    assert not any('buildx' in command for command in get_commands(build_spec, 'pre_build'))
+
+
+def test_build_spec_registry(make_config):
+    build_spec = get_build_spec(make_config(build_cache_mode='registry'))
+
+    assert build_spec['env'] == {'variables': {'DOCKER_CLI_EXPERIMENTAL': 'enabled'}}
+    assert 'IMAGE_CACHE=${REPOSITORY_URI}:buildcache' in get_commands(build_spec, 'pre_build')
+    [build] = [command for command in get_commands(build_spec, 'build') if 'buildx build' in command]
+    assert '--cache-from type=registry,ref=${IMAGE_CACHE}' in build
+
+
+def test_build_spec_invalid_cache_mode(make_config):
+    with pytest.raises(ValueError, match='Invalid build_cache_mode'):
+        get_build_spec(make_config(build_cache_mode='s3'))
+
+
+@pytest.mark.parametrize('published, installed', [('buildx', True), ('tampered', False)])
+def test_build_spec_buildx_checksum(make_config, tmp_path, published, installed):
+    downloads = tmp_path / 'downloads'
+    downloads.mkdir()
+    (downloads / BUILDX_FILE).write_bytes(b'buildx')
+    (downloads / 'checksums.txt').write_text(
+        f'{hashlib.sha256(b"other").hexdigest()} *buildx-{BUILDX_VERSION}.darwin-amd64\n'
+        f'{hashlib.sha256(published.encode()).hexdigest()} *{BUILDX_FILE}\n'
+    )
+    commands = [
+        command for command in get_commands(get_build_spec(make_config(build_cache_mode='registry')), 'pre_build')
+        # the download and the install, without docker
+        if ('buildx' in command.lower() or command.startswith('mkdir')) and 'docker buildx' not in command
+    ]
+
+    result = run_commands(commands, tmp_path, {'curl': FAKE_CURL}, DOWNLOADS=str(downloads))
+
+    assert (result.returncode == 0) is installed
+    assert (tmp_path / '.docker/cli-plugins/docker-buildx').exists() is installed
+
+
+def test_ecr_keeps_build_cache(make_config, synth):
+    template = synth(make_config(build_cache_mode='registry'))
+
+    [repository] = [
+        resource['Properties'] for resource in template['Resources'].values()
+        if resource['Type'] == 'AWS::ECR::Repository'
+    ]
+    rules = json.loads(repository['LifecyclePolicy']['LifecyclePolicyText'])['rules']
+    assert [(rule['rulePriority'], rule['selection']) for rule in rules] == [
+        (1, {
+            'tagStatus': 'tagged', 'tagPrefixList': ['buildcache'], 'countType': 'imageCountMoreThan', 'countNumber': 1,
+        }),
+        (2, {'tagStatus': 'any', 'countType': 'sinceImagePushed', 'countNumber': 30, 'countUnit': 'days'}),
+    ]
+
+
+def test_build_spec_soci_index(make_config):
+    post_build = get_commands(get_build_spec(make_config(build_soci_index=True)), 'post_build')
+
+    soci_commands = [index for index, command in enumerate(post_build) if command.startswith('soci ')]
+    assert [post_build[index].split()[3] for index in soci_commands] == ['create', 'push']
+    # the index of the pushed version, before the build duration
+    assert post_build.index('docker push ${IMAGE_VERSION}') < soci_commands[0]
+    assert 'put-metric-data' in post_build[-1]
+    assert not any('soci' in command for command in get_commands(get_build_spec(make_config()), 'post_build'))
+
+
+@pytest.mark.parametrize('task_arns, output', [
+    ('arn:task/1', 'task image pull: 3.5s start: 10.0s\n'),
+    ('', ''),
+])
+def test_build_spec_task_start_times(make_config, tmp_path, task_arns, output):
+    post_build = get_commands(get_build_spec(make_config(build_soci_index=True)), 'post_build')
+    commands = [command for command in post_build if 'TASK_ARNS' in command]
+    fake_aws = f'''#!/bin/sh
+case "$2" in
+    list-tasks) echo "{task_arns}";;
+    describe-tasks) printf "100.0\\t103.5\\t95.0\\t105.0\\n";;
+esac
+'''
+
+    result = run_commands(commands, tmp_path, {'aws': fake_aws})
+
+    assert result.returncode == 0
+    assert result.stdout == output
+
+
+RELEASE_TASK_DEFINITION = {
+    'taskDefinition': {
+        'taskDefinitionArn': 'arn:aws:ecs:us-east-1:123456789012:task-definition/test-release:3',
+        'family': 'test-release',
+        'revision': 3,
+        'status': 'ACTIVE',
+        'taskRoleArn': 'arn:aws:iam::123456789012:role/task',
+        'executionRoleArn': 'arn:aws:iam::123456789012:role/execution',
+        'networkMode': 'awsvpc',
+        'containerDefinitions': [
+            {'name': 'container', 'image': 'repository:latest', 'command': ['/release']},
+            {'name': 'datadog-agent', 'image': 'datadog/agent:7.49.1'},
+        ],
+        'volumes': [],
+        'requiresCompatibilities': ['FARGATE'],
+        'cpu': '512',
+        'memory': '1024',
+        'ephemeralStorage': {'sizeInGiB': 40},
+        'registeredAt': 1700000000.0,
+    },
+}
+# `wait tasks-stopped` outcomes in the order of the calls, then the exit code of the release container
+FAKE_AWS = '''#!/bin/sh
+echo "$*" >> calls.log
+case "$2" in
+    describe-task-definition) cat described.json;;
+    register-task-definition) cp "${4#file://}" registered.json; echo "arn:task-definition/test-release:4";;
+    run-task) echo "arn:task/1";;
+    wait)
+        outcome=$(head -n 1 waits); sed -i 1d waits
+        case "$outcome" in
+            timeout) echo "Waiter TasksStopped failed: Max attempts exceeded" >&2; exit 255;;
+            denied) echo "An error occurred (AccessDeniedException) when calling DescribeTasks" >&2; exit 254;;
+        esac;;
+    describe-tasks) echo "$EXIT_CODE";;
+esac
+'''
+
+
+def run_release(tmp_path, waits: list, exit_code: str = '0') -> subprocess.CompletedProcess:
+    (tmp_path / 'imagedefinitions.json').write_text('[{"name":"container","imageUri":"repository:abc1234"}]')
+    (tmp_path / 'described.json').write_text(json.dumps(RELEASE_TASK_DEFINITION))
+    (tmp_path / 'waits').write_text('\n'.join(waits) + '\n')
+    commands = get_commands(get_release_build_spec(), 'build')
+    return run_commands(
+        commands, tmp_path, {'aws': FAKE_AWS},
+        ECS_CLUSTER='test', RELEASE_TASK_DEFINITION='test-release', PIPELINE_NAME='test',
+        SUBNET_IDS='subnet-1', SECURITY_GROUP_IDS='sg-1', EXIT_CODE=exit_code,
+    )
+
+
+def get_wait_calls(tmp_path) -> int:
+    return sum(line.startswith('ecs wait') for line in (tmp_path / 'calls.log').read_text().splitlines())
+
+
+@pytest.mark.skipif(not shutil.which('jq'), reason='jq is on the CodeBuild image')
+def test_release_build_spec(tmp_path):
+    result = run_release(tmp_path, ['stopped'])
+
+    assert result.returncode == 0, result.stdout + result.stderr
+    registered = json.loads((tmp_path / 'registered.json').read_text())
+    assert set(registered) == {
+        'family', 'taskRoleArn', 'executionRoleArn', 'networkMode', 'containerDefinitions', 'volumes',
+        'requiresCompatibilities', 'cpu', 'memory', 'ephemeralStorage',
+    }
+    assert [container['image'] for container in registered['containerDefinitions']] == [
+        'repository:abc1234', 'datadog/agent:7.49.1',
+    ]
+    assert '--task-definition arn:task-definition/test-release:4' in (tmp_path / 'calls.log').read_text()
+
+
+@pytest.mark.skipif(not shutil.which('jq'), reason='jq is on the CodeBuild image')
+@pytest.mark.parametrize('waits, exit_code, succeeded, wait_calls', [
+    (['timeout', 'timeout', 'stopped'], '0', True, 3),
+    (['denied', 'stopped'], '0', False, 1),
+    (['stopped'], '1', False, 1),
+])
+def test_release_build_spec_outcomes(tmp_path, waits, exit_code, succeeded, wait_calls):
+    result = run_release(tmp_path, waits, exit_code)
+
+    assert (result.returncode == 0) is succeeded
+    assert get_wait_calls(tmp_path) == wait_calls
+
+
+def test_release_task_size(make_config, synth):
+    template = synth(make_config(release_command=['/release'], app_cpu=1024, app_memory=2048, app_ephemeral_storage=50))
+
+    [release] = [
+        resource['Properties'] for resource in template['Resources'].values()
+        if resource['Type'] == 'AWS::ECS::TaskDefinition' and resource['Properties'].get('Family') == 'test-release'
+    ]
+    assert (release['Cpu'], release['Memory'], release['EphemeralStorage']) == ('1024', '2048', {'SizeInGiB': 50})